@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import sites, demo, protocols, drafts, whatif, feasibility
 from app.routes import llm, surveys, site_profile
@@ -12,7 +13,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="SiteSync API - Clinical Research Feasibility Platform")
+# orjson renders large survey/draft payloads several times faster than stdlib json
+app = FastAPI(
+    title="SiteSync API - Clinical Research Feasibility Platform",
+    default_response_class=ORJSONResponse
+)
 
 # Log startup configuration
 logger.info("=" * 80)
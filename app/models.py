@@ -26,6 +26,11 @@ class Site(Base):
 
     # Relationships
     surveys = relationship("Survey", back_populates="site")
+    # Child rows are removed by the ON DELETE CASCADE foreign keys
+    equipment = relationship("SiteEquipment", back_populates="site", passive_deletes=True)
+    staff = relationship("SiteStaff", back_populates="site", passive_deletes=True)
+    history = relationship("SiteHistory", back_populates="site", passive_deletes=True)
+    patient_capabilities = relationship("SitePatientCapability", back_populates="site", passive_deletes=True)
 
 class SiteTruthField(Base):
     __tablename__ = "site_truth_fields"
@@ -49,7 +54,7 @@ class SiteEquipment(Base):
     specs = Column(JSON, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    site = relationship("Site")
+    site = relationship("Site", back_populates="equipment")
 
 class SiteStaff(Base):
     __tablename__ = "site_staff"
@@ -61,7 +66,7 @@ class SiteStaff(Base):
     experience_years = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    site = relationship("Site")
+    site = relationship("Site", back_populates="staff")
 
 class SiteHistory(Base):
     __tablename__ = "site_history"
@@ -75,7 +80,7 @@ class SiteHistory(Base):
     n_trials = Column(Integer, default=1)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    site = relationship("Site")
+    site = relationship("Site", back_populates="history")
 
 class Protocol(Base):
     __tablename__ = "protocols"
@@ -125,7 +130,7 @@ class SitePatientCapability(Base):
     notes = Column(Text, nullable=True)
     evidence_url = Column(Text, nullable=True)
 
-    site = relationship("Site")
+    site = relationship("Site", back_populates="patient_capabilities")
 
 class FeasibilityAssessment(Base):
     __tablename__ = "feasibility_assessments"
@@ -1,5 +1,6 @@
 # app/routes/drafts.py
 from __future__ import annotations
+import orjson
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
@@ -61,15 +62,42 @@ def draft_autofill(body: DraftRequest, db: Session = Depends(get_session)):
     if "error" in base:
         raise HTTPException(status_code=400, detail=base["error"])
 
-    objective = base.get("objective_answers", {})
-    missing = base.get("unresolved_missing_data", [])
+    objective = {a["key"]: a["proposed_answer"] for a in base.get("objective_answers", [])}
+    missing = [m["key"] for m in base.get("unresolved_missing_data", [])]
     subjective = base.get("unresolved_subjective", [])
 
+    # Questions keyed to a field the rule-based draft already resolved are answered
+    # straight from site truth; only the remaining questions go to the LLM
+    answers: Dict[str, str] = {
+        q.id: str(objective[q.key]) for q in body.questions if q.key in objective
+    }
+    pending = [q for q in body.questions if q.id not in answers]
+    if pending:
+        answers.update(_draft_with_llm(protocol, objective, missing, pending))
+
+    # Guarantee every question has an answer
+    for q in body.questions:
+        answers.setdefault(q.id, "Unknown – requires site input")
+
+    return DraftOut(
+        protocol_id=body.protocol_id,
+        site_id=body.site_id,
+        answers=answers,
+        notes="Generated with site facts; review subjective items before sending to sponsors."
+    )
+
+def _draft_with_llm(
+    protocol: models.Protocol,
+    objective: Dict[str, Any],
+    missing: List[str],
+    questions: List[QuestionIn],
+) -> Dict[str, str]:
+    """Draft answers for questions the rule-based draft could not resolve."""
     # Build a clean context
     context = _format_context(protocol, objective, missing)
 
     # Build a single prompt asking for JSON answers keyed by question IDs
-    questions_json = [{ "id": q.id, "text": q.text, "key": q.key } for q in body.questions]
+    questions_json = [{ "id": q.id, "text": q.text, "key": q.key } for q in questions]
     user_prompt = f"""
 CONTEXT
 {context}
@@ -88,37 +116,38 @@ NOTES
         {"role": "user", "content": user_prompt.strip()},
     ]
 
-    raw = generate(messages, temperature=0.15, max_tokens=900).strip()
+    # Only a reply that parses as a JSON object is worth caching
+    raw = generate(
+        messages, temperature=0.15, max_tokens=900,
+        accept=lambda reply: isinstance(_parse_answers_json(reply), dict)
+    ).strip()
 
     # Try to parse a top-level JSON object. If not JSON, wrap as a single note-answer.
     answers: Dict[str, str] = {}
-    try:
-        maybe = raw
-        # Some models reply with code fences; strip them
-        if maybe.startswith("```"):
-            maybe = maybe.strip("`")
-            # remove leading 'json' if present
-            if maybe.lower().startswith("json"):
-                maybe = maybe[4:]
-        data = json.loads(maybe)  # type: ignore[name-defined]
-        if isinstance(data, dict):
-            # Ensure only known ids are kept, values are strings
-            ids = {q.id for q in body.questions}
-            for k, v in data.items():
-                if k in ids:
-                    answers[k] = v if isinstance(v, str) else str(v)
-    except Exception:
+    data = _parse_answers_json(raw)
+    if data is None:
         # fallback: single blob into all questions
-        for q in body.questions:
+        for q in questions:
             answers[q.id] = f"(Model freeform output)\n{raw}"
-
-    # Guarantee every question has an answer
-    for q in body.questions:
-        answers.setdefault(q.id, "Unknown – requires site input")
-
-    return DraftOut(
-        protocol_id=body.protocol_id,
-        site_id=body.site_id,
-        answers=answers,
-        notes="Generated with site facts; review subjective items before sending to sponsors."
-    )
+    elif isinstance(data, dict):
+        # Ensure only known ids are kept, values are strings
+        ids = {q.id for q in questions}
+        for k, v in data.items():
+            if k in ids:
+                answers[k] = v if isinstance(v, str) else str(v)
+
+    return answers
+
+def _parse_answers_json(raw: str):
+    """Parse the model's JSON reply, or None if it is not JSON"""
+    maybe = raw.strip()
+    # Some models reply with code fences; strip them
+    if maybe.startswith("```"):
+        maybe = maybe.strip("`")
+        # remove leading 'json' if present
+        if maybe.lower().startswith("json"):
+            maybe = maybe[4:]
+    try:
+        return orjson.loads(maybe)
+    except orjson.JSONDecodeError:
+        return None
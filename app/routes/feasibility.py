@@ -30,7 +30,7 @@ async def process_protocol_for_feasibility(
 
         # Process with feasibility processor
         processor = FeasibilityProcessor()
-        result = processor.process_protocol_for_feasibility(
+        result = await processor.process_protocol_for_feasibility(
             db=db,
             protocol_pdf_bytes=pdf_content,
             site_id=site_id
@@ -4,12 +4,18 @@ Uses OpenAI to intelligently map survey questions to site profile data
 """
 
 import os
+import re
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+import numpy as np
 from app.services.openai_client import get_openai_client
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AIQuestionMapping:
     question_id: str
     question_text: str
@@ -19,6 +25,371 @@ class AIQuestionMapping:
     source: str
     reasoning: str
 
+
+def _keyword_tokens(text: str) -> Tuple[frozenset, frozenset]:
+    """
+    Tokenize question text once so keyword checks become set lookups.
+    Plural words also contribute their singular form ("participants" -> "participant").
+    Returns (tokens, bigrams).
+    """
+    words = re.findall(r"[a-z0-9]+", text.lower().replace("'s", ""))
+    tokens = frozenset(words) | frozenset(w[:-1] for w in words if len(w) > 3 and w.endswith('s'))
+    bigrams = frozenset(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return tokens, bigrams
+
+# Questions per bulk categorize/map API call
+BATCH_CHUNK_SIZE = 20
+
+# Mappings at or below this confidence are not autofilled
+AUTOFILL_MIN_CONFIDENCE = 0.3
+# Mapped values that are placeholders rather than real answers (a tuple, since
+# mapped_value may be an unhashable LLM-returned list)
+_NON_ANSWERS = ('Manual review required', 'Requires manual review', 'No answer provided', 'Not processed')
+# Response for subjective questions; only id/text/type vary (same key order as _build_response)
+_SUBJECTIVE_RESPONSE = {
+    'id': '',
+    'text': '',
+    'type': 'text',
+    'is_objective': False,
+    'response': '',
+    'source': 'manual_required',
+    'confidence': 0.0,
+    'manually_edited': False,
+    'reasoning': 'Subjective question requires manual input'
+}
+
+# Plain lookups ("How many coordinators?", "Do you have MRI?") that can go to the
+# smaller LLM_FAST_MODEL; adequacy/requirement judgements stay on the main model
+_LOW_RISK_QUESTION_RE = re.compile(r'^\s*(how many|do you have|does (your|the) site have|who is)\b', re.IGNORECASE)
+_NEEDS_JUDGEMENT_RE = re.compile(r'\b(adequate|sufficient|enough|needed|required|necessary|able to)\b', re.IGNORECASE)
+
+# Strict JSON schemas for constrained decoding (models that support response_format)
+MAPPING_JSON_SCHEMA = {
+    "name": "question_mapping",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "mapped_field": {"type": "string"},
+            "mapped_value": {"type": "string"},
+            "confidence_score": {"type": "number"},
+            "reasoning": {"type": "string"},
+        },
+        "required": ["mapped_field", "mapped_value", "confidence_score", "reasoning"],
+        "additionalProperties": False,
+    },
+}
+_BATCH_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": ["OBJECTIVE", "SUBJECTIVE"]},
+        "answer": {"type": "string"},
+        "confidence": {"type": "number"},
+        "reasoning": {"type": "string"},
+    },
+    "required": ["category", "answer", "confidence", "reasoning"],
+    "additionalProperties": False,
+}
+
+def _batch_json_schema(question_ids: List[str]) -> Dict[str, Any]:
+    """Batch responses are keyed by question id, so the schema lists this chunk's ids"""
+    return {
+        "name": "batch_question_mappings",
+        "schema": {
+            "type": "object",
+            "properties": {q_id: _BATCH_ITEM_SCHEMA for q_id in question_ids},
+            "required": list(question_ids),
+            "additionalProperties": False,
+        },
+    }
+
+# Upper bound on LLM requests in flight at once (keeps us under provider rate limits).
+# Pools size themselves from it, but nested pools (chunk workers falling back to
+# per-question calls) can exceed it, so every API call also takes a slot here.
+MAX_CONCURRENT_LLM_CALLS = 8
+_llm_call_slots = threading.BoundedSemaphore(MAX_CONCURRENT_LLM_CALLS)
+
+# In-process cache of AI mappings keyed by normalized question text + site profile
+# fingerprint, so repeated surveys (and repeated questions) skip the LLM entirely.
+# The fingerprint covers protocol_requirements, so any profile/protocol change misses.
+MAPPING_CACHE_SIZE = 4096
+_UNCACHEABLE_SOURCES = {'batch_missing', 'mapping_error', 'ai_fallback'}
+_mapping_cache: "OrderedDict[str, AIQuestionMapping]" = OrderedDict()
+
+
+def normalize_question_ids(questions: List[Dict]) -> List[Dict]:
+    """
+    Give every question an id (positional q_1, q_2, ... for those missing one), in place.
+    Call once at ingestion; the mapper then indexes questions by question['id'].
+    """
+    for i, question in enumerate(questions):
+        question.setdefault('id', f'q_{i+1}')
+    return questions
+
+
+def _profile_fingerprint(site_profile: Dict) -> str:
+    """Stable hash of the site profile (including any merged protocol requirements)"""
+    payload = json.dumps(site_profile, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _mapping_cache_key(question_text: str, fingerprint: str) -> str:
+    # Case, whitespace and trailing punctuation don't change the question
+    normalized = ' '.join(question_text.lower().split()).rstrip('?.:! ')
+    return hashlib.blake2b(f"{normalized}:{fingerprint}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _get_cached_mapping(key: str, question: Dict) -> Optional[AIQuestionMapping]:
+    cached = _mapping_cache.get(key)
+    if cached is None:
+        return None
+    _mapping_cache.move_to_end(key)
+    # Re-stamp with this question's id/text (ids differ between surveys)
+    return replace(cached, question_id=question.get('id', ''), question_text=question.get('text', ''))
+
+
+def _cache_mapping(key: str, mapping: AIQuestionMapping) -> None:
+    if mapping.source in _UNCACHEABLE_SOURCES or mapping.confidence_score <= 0:
+        return
+    _mapping_cache[key] = mapping
+    _mapping_cache.move_to_end(key)
+    if len(_mapping_cache) > MAPPING_CACHE_SIZE:
+        _mapping_cache.popitem(last=False)
+
+# Static half of the single-question validation prompt. Only the question,
+# protocol requirements and site summary vary per call, so the rubric and
+# few-shot examples are built once at import time and sent in the system
+# message (see VALIDATION_SYSTEM_MESSAGE below).
+VALIDATION_RUBRIC = """QUESTION TYPE DETECTION:
+1. **Numeric questions** (What is..., How many..., How long...) → Return the NUMBER or VALUE from protocol/site
+   - "What is the phase?" → "Phase III" (not "Yes, site can conduct Phase III")
+   - "How many coordinators?" → "5 coordinators" (not "Yes, adequate staff")
+
+2. **List questions** (What procedures/equipment/departments...) → Return COMMA-SEPARATED LIST
+   - "What procedures will be performed?" → "Liver biopsy, MRI-PDFF, FibroScan, ECG"
+   - "What departments are required?" → "Hepatology, Radiology, Pharmacy, Laboratory"
+   - DO NOT answer with "Yes, site can..." for list questions
+
+3. **Binary choice questions** (X or Y?) → Choose ONE option, not Yes/No
+   - "Clinical or Academic?" → "Clinical" or "Academic" (not "Yes, site meets...")
+   - Return the most appropriate option from the choices given
+
+4. **Capability questions** (Is..., Does..., Can...) → Validate if site meets requirements
+   - "Is equipment available?" → "Yes, site has FibroScan" OR "No, site lacks FibroScan"
+
+CRITICAL - INVERTED QUESTION LOGIC:
+⚠️ When questions ask "Are X needed?" or "Is X necessary?", the logic is INVERTED:
+- If site LACKS the requirement → Answer "Yes, need [specific requirement]"
+- If site HAS the requirement → Answer "No, site has [capability]"
+
+CORRECT INVERTED LOGIC EXAMPLES:
+Q: "Are additional specialists needed?"
+Protocol needs: Hepatology PI
+Site has: Cardiology PI only
+✅ CORRECT: "Yes, need PI with hepatology specialization"
+❌ WRONG: "No, site lacks hepatology PI"
+
+Q: "Is additional training necessary?"
+Protocol needs: ACLS certification
+Site has: GCP only
+✅ CORRECT: "Yes, need ACLS certification training"
+❌ WRONG: "No, additional training is necessary"
+
+Q: "Are additional specialists needed?"
+Protocol needs: Hepatology PI
+Site has: Dr. Jane Doe (Hepatology PI)
+✅ CORRECT: "No, site has hepatology PI (Dr. Jane Doe)"
+❌ WRONG: "Yes, all specialists available"
+
+REQUIREMENT VALIDATION LOGIC:
+1. **Identify what type of question this is** (numeric vs capability)
+2. **For numeric questions**: Return the specific value from protocol or site data
+3. **For capability questions**: Compare protocol requirements to site capabilities
+4. **Answer naturally and accurately**:
+   - Numeric answer: "Phase III", "48 weeks", "30 patients", "5 coordinators"
+   - Capability match: "Yes, [specific reason]"
+   - Capability gap: "No, [specific gap]"
+   - Uncertain: "Unable to determine [what's missing]"
+   - Partial: "Partially - [what's available and what's missing]"
+
+VALIDATION EXAMPLES:
+
+Example 1 - Clear Gap (Staff):
+Q: "Does the site have adequate staff to conduct this study?"
+Protocol Needs: PI with hepatology experience (0.3 FTE), FibroScan trained coordinator
+Site Has: 3 PIs (Cardiology, Oncology, Endocrinology), 5 coordinators (GCP certified)
+CORRECT Answer: "No, site lacks PI with hepatology experience and FibroScan trained personnel"
+WRONG Answer: "Yes - 3 PIs and 5 coordinators available" ❌
+
+Example 2 - Partial Match (Equipment):
+Q: "Is specialized equipment required for this study available?"
+Protocol Needs: [CRITICAL] FibroScan device, [CRITICAL] MRI with PDFF capability
+Site Has: MRI (1.5T standard), CT Scanner, Ultrasound
+CORRECT Answer: "Partially - site has MRI but not with PDFF capability, and lacks FibroScan device"
+WRONG Answer: "Yes - MRI and imaging equipment available" ❌
+
+Example 3 - Clear Match (Population):
+Q: "Do you have access to the required patient population?"
+Protocol Needs: NASH patients with F2-F3 fibrosis, 8-12 patients over 12 months
+Site Has: 450 NASH patients annually, established screening program
+CORRECT Answer: "Yes, site has 450 NASH patients annually and can easily meet 8-12 patient requirement"
+WRONG Answer: "450 patients available" (not a clear answer) ❌
+
+Example 4 - Insufficient Information:
+Q: "Can site support the required visit schedule?"
+Protocol Needs: [Information not provided in protocol]
+Site Has: Flexible scheduling, experienced coordinators
+CORRECT Answer: "Unable to determine without protocol's specific visit schedule requirements"
+WRONG Answer: "Yes - site has flexible scheduling" ❌
+
+DIRECT PROTOCOL DATA MAPPING:
+When survey questions ask about protocol details, use extracted protocol data:
+
+Example 5 - Protocol Phase:
+Q: "What is the protocol phase?"
+Protocol: Phase III
+CORRECT Answer: "Phase III"
+WRONG Answer: "Yes, site can conduct Phase III trials" ❌
+
+Example 6 - Study Duration:
+Q: "What is the duration of the study?"
+Protocol: 48 weeks total duration
+CORRECT Answer: "48 weeks (12 months)"
+WRONG Answer: "Site can support long studies" ❌
+
+Example 7 - Enrollment Target:
+Q: "How many patients need to be enrolled?"
+Protocol: Enrollment target 30 patients
+CORRECT Answer: "30 patients"
+WRONG Answer: "Site has capacity for enrollment" ❌
+
+Example 8 - Sponsor Name:
+Q: "Who is the sponsor?"
+Protocol: Sponsor - Novartis Pharmaceuticals
+CORRECT Answer: "Novartis Pharmaceuticals"
+WRONG Answer: "Site has worked with major sponsors" ❌
+
+Example 9 - List Questions:
+Q: "What procedures will be performed?"
+Protocol: Liver biopsy, MRI-PDFF, FibroScan, ECG, blood sampling
+CORRECT Answer: "Liver biopsy, MRI-PDFF, FibroScan, ECG, blood sampling"
+WRONG Answer: "Yes, site can perform all required procedures" ❌
+
+Example 10 - List Questions (Departments):
+Q: "What departments/services are required?"
+Protocol: Hepatology clinic, Radiology, Clinical pharmacy, Central lab
+CORRECT Answer: "Hepatology, Radiology, Pharmacy, Laboratory"
+WRONG Answer: "Yes, coordination with other departments will be required" ❌
+
+Example 11 - Binary Choice Questions:
+Q: "Is this study for Clinical Reasons or Academic?"
+Protocol: Industry-sponsored Phase II trial
+CORRECT Answer: "Clinical"
+WRONG Answer: "Yes, site meets all protocol requirements" ❌
+
+Response format - return ONLY valid JSON:
+{
+    "mapped_field": "requirement category being validated (e.g., 'staff_requirements', 'equipment_required')",
+    "mapped_value": "Natural answer: 'Yes, [reason]' OR 'No, [gap]' OR 'Partially - [details]' OR 'Unable to determine [what's needed]'",
+    "confidence_score": 0.0-1.0 (high if clear match/mismatch, medium for partial, low for uncertain),
+    "reasoning": "Requirement validation logic: what protocol needs vs what site has"
+}
+
+REQUIREMENT VALIDATION PATTERNS:
+
+STAFF VALIDATION:
+- "Adequate staff?" → Compare protocol's specific staff needs (PI specialty, coordinator training, FTE) to site's actual staff
+  Example: Protocol needs "PI with hepatology" → Check if ANY site PI has hepatology specialty
+- "PI qualified?" → Verify PI specialty matches protocol's therapeutic area
+- "Coordinator experience?" → Check if coordinators have protocol-specific training (GCP, device-specific, etc.)
+
+EQUIPMENT VALIDATION:
+- "Equipment available?" → Check if EVERY piece of critical equipment in protocol is available at site
+  Example: Protocol needs "FibroScan" → Answer "No" if site only has standard imaging
+- "Special procedures possible?" → Validate site can perform protocol-specific procedures
+- "Lab capabilities sufficient?" → Ensure lab certifications match protocol requirements
+
+POPULATION VALIDATION:
+- "Access to population?" → Verify site has protocol's SPECIFIC patient type AND volume
+  Example: Protocol needs "NASH F2-F3" → Check if site has NASH patients with fibrosis staging capability
+- "Enrollment feasible?" → Compare protocol's target enrollment to site's actual patient volume
+- "Age criteria met?" → Verify site's patient age range covers protocol's requirements
+
+EXPERIENCE VALIDATION:
+- "Prior experience?" → Check if site has run studies in protocol's EXACT therapeutic area
+  Example: Protocol is NASH Phase II → Check for prior NASH or hepatology experience (not just general GI)
+- "Phase experience?" → Verify site has conducted studies at protocol's phase level
+
+CRITICAL REQUIREMENT VALIDATION RULES:
+
+1. **ALWAYS compare protocol to site** - Never just list what site has
+   ❌ WRONG: "Site has 3 PIs and 5 coordinators"
+   ✅ RIGHT: "No, site lacks PI with required hepatology specialty"
+
+2. **Answer naturally with appropriate format** - Don't force Yes/No when uncertain or partial
+   ❌ WRONG: "Yes" or "No" (no explanation)
+   ✅ RIGHT: "Yes, site has FibroScan and all required imaging"
+   ✅ RIGHT: "Partially - site has MRI but lacks PDFF capability"
+   ✅ RIGHT: "Unable to determine without protocol's specific visit schedule"
+
+3. **WHO questions** → Names or "Unknown", never numbers
+   ✅ "Principal Investigator Name" or "Unknown"
+   ❌ "Yes" or "5"
+
+4. **Match SPECIFIC protocol requirements**, not general capabilities
+   Example: Protocol needs "NASH patients with F2-F3 fibrosis"
+   ❌ WRONG: "Yes - 450 NASH patients available"
+   ✅ RIGHT: "Yes, 450 NASH patients with FibroScan for fibrosis staging"
+   ✅ RIGHT: "Partially - 450 NASH patients but no fibrosis staging capability"
+
+5. **Use "Partially" for partial matches** - ONE missing requirement ≠ complete "No"
+   Example: Protocol needs [CRITICAL] FibroScan + [CRITICAL] Hepatology PI
+   Site has: FibroScan but no hepatology PI
+   ✅ RIGHT: "Partially - site has FibroScan but lacks PI with hepatology specialization (critical gap)"
+   ❌ WRONG: "No" (ignores what site DOES have)
+
+6. **Provide actionable gap analysis in all answers**
+   ❌ WRONG: "No - inadequate"
+   ✅ RIGHT: "No, missing FibroScan device and hepatology-trained staff"
+   ✅ RIGHT: "Partially - has FibroScan but lacks hepatology-trained staff"
+
+EXAMPLES OF CORRECT SEMANTIC MATCHING:
+Q: "Who is the PI?" → A: "Principal Investigator Name" or "Unknown" (not "Yes" or numbers)
+Q: "Who is the sponsor?" → A: "Sponsor name to be determined" or "Unknown" (not "Yes" or booleans)
+Q: "Do you have imaging capability?" → A: "Yes" (not "MRI 1.5T, CT 64-slice")
+Q: "What imaging equipment is available?" → A: "MRI (1.5T), CT (64-slice), Ultrasound, DEXA"
+Q: "How many research coordinators?" → A: "5" (not "5 coordinators with avg 6 years experience")
+Q: "Adequate staff to conduct study?" → A: "Yes" (not "5 coordinators, 3 investigators")
+"""
+
+# Used instead of VALIDATION_RUBRIC when no protocol has been extracted: there
+# is nothing to validate against, so only the answer-format rules are sent.
+SITE_ONLY_RUBRIC = """No protocol document is available. Answer from SITE CAPABILITIES only.
+
+QUESTION TYPE DETECTION:
+1. **Numeric questions** (What is..., How many..., How long...) → Return the NUMBER or VALUE from site data
+2. **List questions** (What procedures/equipment/departments...) → Return COMMA-SEPARATED LIST
+3. **Binary choice questions** (X or Y?) → Choose ONE option, not Yes/No
+4. **Capability questions** (Is..., Does..., Can...) → "Yes, [specific reason]" OR "No, [specific gap]"
+
+If the answer depends on protocol details, answer "Unable to determine without protocol [what's missing]" with low confidence.
+WHO questions → Names or "Unknown", never numbers.
+
+Response format - return ONLY valid JSON:
+{
+    "mapped_field": "site profile field or category used (e.g., 'staff_and_experience', 'facilities_and_equipment')",
+    "mapped_value": "Natural answer: value, list, 'Yes, [reason]' OR 'No, [gap]' OR 'Unable to determine [what's needed]'",
+    "confidence_score": 0.0-1.0 (high if answered directly from site data, low for uncertain),
+    "reasoning": "Which site data supports the answer"
+}
+"""
+
+# The rubrics go in the system message so every call shares an identical,
+# stable prefix - this is what provider-side prompt caching keys on. The
+# per-question user message only carries the question, protocol and site.
+_ASSESSOR_SYSTEM = "You are a CLINICAL TRIAL FEASIBILITY ASSESSOR. Your job is to VALIDATE if the site can run THIS SPECIFIC PROTOCOL by comparing protocol requirements to site capabilities. Be DECISIVE - answer Yes only if ALL requirements are met, No if ANY are missing. Provide specific gap analysis. Return only valid JSON."
+VALIDATION_SYSTEM_MESSAGE = f"{_ASSESSOR_SYSTEM}\n\n{VALIDATION_RUBRIC}"
+SITE_ONLY_SYSTEM_MESSAGE = f"{_ASSESSOR_SYSTEM}\n\n{SITE_ONLY_RUBRIC}"
+
 class AIQuestionMapper:
     """
     Uses AI to intelligently understand survey questions and map them to
@@ -30,9 +401,10 @@ class AIQuestionMapper:
 
     def bulk_categorize_and_map(self, questions: List[Dict], site_profile: Dict) -> List[AIQuestionMapping]:
         """
-        BATCHED APPROACH: Categorize AND map ALL questions in ONE API call.
+        BATCHED APPROACH: Categorize AND map questions in chunked batch API calls.
 
-        Reduces 114 individual API calls to 1 batch call.
+        Reduces 114 individual API calls to ceil(N / BATCH_CHUNK_SIZE) batch calls;
+        a failed chunk falls back to per-question mapping for that chunk only.
         Target: <10 seconds total processing time.
 
         Returns mappings for all questions with categorization + answers.
@@ -40,53 +412,106 @@ class AIQuestionMapper:
         import logging
         logger = logging.getLogger(__name__)
 
-        # Pre-filter obvious patterns (skip AI for these)
+        # Pre-filter obvious patterns and cached answers (skip AI for these)
         mappings = []
         ai_needed_questions = []
+        cache_keys = {}
+        # Repeats of an already-pending question (same normalized text), answered
+        # from the first occurrence's mapping instead of a second LLM slot
+        duplicates: Dict[str, List[Dict]] = {}
+        fingerprint = _profile_fingerprint(site_profile)
 
         for question in questions:
-            q_text = question.get('text', '').lower()
-            q_id = question.get('id', '')
+            q_id = question['id']
 
             # Heuristic categorization - skip AI for obvious cases
             obvious_mapping = self._apply_heuristics(question, site_profile)
             if obvious_mapping:
                 mappings.append(obvious_mapping)
                 logger.info(f"✓ Heuristic match for: {question.get('text', '')[:60]}")
+                continue
+
+            cache_key = _mapping_cache_key(question.get('text', ''), fingerprint)
+            cached_mapping = _get_cached_mapping(cache_key, question)
+            if cached_mapping:
+                mappings.append(cached_mapping)
+            elif cache_key in duplicates:
+                duplicates[cache_key].append(question)
             else:
+                cache_keys[q_id] = cache_key
+                duplicates[cache_key] = []
                 ai_needed_questions.append(question)
 
-        # If all questions handled by heuristics, return early
+        # If all questions handled by heuristics/cache, return early
         if not ai_needed_questions:
-            logger.info(f"✅ All {len(questions)} questions handled by heuristics (0 API calls)")
+            logger.info(f"✅ All {len(questions)} questions handled by heuristics or cache (0 API calls)")
             return mappings
 
-        # Batch process remaining questions with ONE API call
-        logger.info(f"🤖 Batch processing {len(ai_needed_questions)} questions in ONE API call...")
+        # Batch process remaining questions, BATCH_CHUNK_SIZE questions per API call
+        # so large surveys don't overflow the completion budget and truncate the JSON
+        chunk_count = (len(ai_needed_questions) + BATCH_CHUNK_SIZE - 1) // BATCH_CHUNK_SIZE
+        duplicate_count = sum(len(dups) for dups in duplicates.values())
+        logger.info(f"🤖 Batch processing {len(ai_needed_questions)} questions in {chunk_count} API call(s) "
+                    f"({duplicate_count} duplicate questions reuse those answers)...")
+
+        compressed_summary = self._create_compressed_site_summary(site_profile)
+        chunks = [
+            ai_needed_questions[start:start + BATCH_CHUNK_SIZE]
+            for start in range(0, len(ai_needed_questions), BATCH_CHUNK_SIZE)
+        ]
+
+        # Chunks are independent, I/O-bound API calls - issue them concurrently
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_LLM_CALLS, len(chunks))) as pool:
+            chunk_results = list(pool.map(
+                lambda chunk: self._map_chunk(chunk, site_profile, compressed_summary),
+                chunks
+            ))
+
+        for chunk_mappings in chunk_results:
+            mappings.extend(chunk_mappings)
+            for mapping in chunk_mappings:
+                cache_key = cache_keys[mapping.question_id]
+                _cache_mapping(cache_key, mapping)
+                for duplicate in duplicates[cache_key]:
+                    mappings.append(replace(
+                        mapping, question_id=duplicate['id'], question_text=duplicate.get('text', '')
+                    ))
+
+        return mappings
+
+    def _map_chunk(self, chunk: List[Dict], site_profile: Dict, compressed_summary: str) -> List[AIQuestionMapping]:
+        """Map one chunk with a single batch call, falling back to per-question calls if it fails"""
+        import logging
+        logger = logging.getLogger(__name__)
 
         try:
             batch_mappings = self._batch_categorize_and_map_with_ai(
-                ai_needed_questions,
-                site_profile
+                chunk,
+                site_profile,
+                site_summary=compressed_summary
             )
-            mappings.extend(batch_mappings)
             logger.info(f"✅ Batch mapping complete: {len(batch_mappings)} questions processed")
+            return batch_mappings
         except Exception as e:
             logger.error(f"❌ Batch mapping failed: {e}")
-            # Fallback to individual mapping for failed batch
-            for question in ai_needed_questions:
-                try:
-                    mapping = self._map_single_question_with_ai(
-                        question,
-                        self._create_site_profile_summary(site_profile),
-                        site_profile
-                    )
-                    if mapping:
-                        mappings.append(mapping)
-                except Exception as e2:
-                    logger.error(f"Failed to map {question.get('text', '')}: {e2}")
+            # Fallback to individual mapping for this chunk only
+            return self._map_individually(chunk, self._create_site_profile_summary(site_profile), site_profile)
 
-        return mappings
+    def _map_individually(self, questions: List[Dict], site_summary: str, site_profile: Dict) -> List[AIQuestionMapping]:
+        """Run _map_single_question_with_ai concurrently (bounded by MAX_CONCURRENT_LLM_CALLS)"""
+        import logging
+        logger = logging.getLogger(__name__)
+        prompt_prefix = self._build_protocol_prompt_prefix(site_summary, site_profile)
+
+        def map_one(question: Dict) -> Optional[AIQuestionMapping]:
+            try:
+                return self._map_single_question_with_ai(question, site_summary, site_profile, prompt_prefix)
+            except Exception as e:
+                logger.error(f"Failed to map {question.get('text', '')}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_LLM_CALLS) as pool:
+            return [mapping for mapping in pool.map(map_one, questions) if mapping]
 
     def _apply_heuristics(self, question: Dict, site_profile: Dict) -> Optional[AIQuestionMapping]:
         """Apply simple pattern matching for obvious questions"""
@@ -150,22 +575,24 @@ class AIQuestionMapper:
     def _batch_categorize_and_map_with_ai(
         self,
         questions: List[Dict],
-        site_profile: Dict
+        site_profile: Dict,
+        site_summary: Optional[str] = None
     ) -> List[AIQuestionMapping]:
         """
-        Process ALL questions in ONE API call.
+        Process ALL given questions in ONE API call.
         Request format: {question_id: {category, answer, confidence}}
         """
         import logging
         logger = logging.getLogger(__name__)
 
-        # Create compressed site profile
-        site_summary = self._create_compressed_site_summary(site_profile)
+        # Create compressed site profile (callers batching in chunks pass it in)
+        if site_summary is None:
+            site_summary = self._create_compressed_site_summary(site_profile)
 
         # Build batch prompt
         questions_dict = {
-            q.get('id', f'q{i}'): q.get('text', '')
-            for i, q in enumerate(questions)
+            q['id']: q.get('text', '')
+            for q in questions
         }
 
         prompt = f"""Given these survey questions and site profile, categorize AND map ALL questions.
@@ -194,17 +621,19 @@ Return JSON format:
 }}"""
 
         try:
-            result = self.openai_client.create_json_completion(
-                prompt=prompt,
-                system_message="You are a clinical trial feasibility expert. Categorize questions as OBJECTIVE (answerable from site data) or SUBJECTIVE (needs human judgment). Provide specific answers for objective questions using the site profile data.",
-                temperature=0.1,
-                max_tokens=4000
-            )
+            with _llm_call_slots:
+                result = self.openai_client.create_json_completion(
+                    prompt=prompt,
+                    system_message="You are a clinical trial feasibility expert. Categorize questions as OBJECTIVE (answerable from site data) or SUBJECTIVE (needs human judgment). Provide specific answers for objective questions using the site profile data.",
+                    temperature=0.1,
+                    max_tokens=4000,
+                    json_schema=_batch_json_schema(list(questions_dict))
+                )
 
             # Convert JSON response to AIQuestionMapping objects
             mappings = []
             for q in questions:
-                q_id = q.get('id', '')
+                q_id = q['id']
                 q_text = q.get('text', '')
 
                 if q_id in result:
@@ -328,20 +757,17 @@ Return JSON format:
         """
         Use AI to intelligently map each question to the most appropriate site profile field
         """
-        mappings = []
-
         # Create a comprehensive site profile summary for the AI
         site_summary = self._create_site_profile_summary(site_profile)
+        prompt_prefix = self._build_protocol_prompt_prefix(site_summary, site_profile)
 
-        for question in questions:
+        def map_one(question: Dict) -> Optional[AIQuestionMapping]:
             try:
-                mapping = self._map_single_question_with_ai(question, site_summary, site_profile)
-                if mapping:
-                    mappings.append(mapping)
+                return self._map_single_question_with_ai(question, site_summary, site_profile, prompt_prefix)
             except Exception as e:
                 print(f"Error mapping question '{question.get('text', '')}': {e}")
                 # Fallback to unmapped
-                mappings.append(AIQuestionMapping(
+                return AIQuestionMapping(
                     question_id=question.get('id', ''),
                     question_text=question.get('text', ''),
                     mapped_field='unmapped',
@@ -349,9 +775,11 @@ Return JSON format:
                     confidence_score=0.0,
                     source='mapping_error',
                     reasoning=f"Error during mapping: {str(e)}"
-                ))
+                )
 
-        return mappings
+        # One API call per question - issue them concurrently
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_LLM_CALLS) as pool:
+            return [mapping for mapping in pool.map(map_one, questions) if mapping]
 
     def _create_site_profile_summary(self, site_profile: Dict) -> str:
         """
@@ -613,9 +1041,67 @@ Return JSON format:
 
         return "\n".join(summary)
 
-    def _map_single_question_with_ai(self, question: Dict, site_summary: str, site_profile: Dict) -> Optional[AIQuestionMapping]:
+    def _direct(
+        self,
+        question: Dict,
+        field: str,
+        value: Any,
+        reason: str,
+        confidence: float = 0.95,
+        source: str = 'protocol_direct'
+    ) -> AIQuestionMapping:
+        """Build a mapping for a question answered directly from protocol/site data"""
+        return AIQuestionMapping(
+            question_id=question.get('id', ''),
+            question_text=question.get('text', ''),
+            mapped_field=field,
+            mapped_value=value,
+            confidence_score=confidence,
+            source=source,
+            reasoning=reason
+        )
+
+    def _model_for_question(self, question_text: str) -> Optional[str]:
+        """Route low-risk lookup questions to the fast model (None = default model)"""
+        if _LOW_RISK_QUESTION_RE.match(question_text) and not _NEEDS_JUDGEMENT_RE.search(question_text):
+            return self.openai_client.fast_model
+        return None
+
+    def _build_protocol_prompt_prefix(self, site_summary: str, site_profile: Dict) -> str:
         """
-        Use AI to validate if site meets protocol requirements for this question
+        Question-independent head of the Type 4 validation prompt (protocol requirements
+        + site capabilities). Built once per batch and shared by every question, so the
+        per-question prompt is just this prefix plus the question.
+        """
+        protocol_requirements = site_profile.get('protocol_requirements', {})
+        if not protocol_requirements:
+            # No protocol extracted - skip formatting requirements and use the
+            # shorter site-only rubric instead of the full validation rubric
+            return f"""You are a FEASIBILITY ASSESSOR answering a site feasibility question.
+
+SITE CAPABILITIES:
+{site_summary}
+"""
+
+        requirements_summary = self._format_protocol_requirements(protocol_requirements)
+        return f"""You are a FEASIBILITY ASSESSOR checking if this site can run THIS SPECIFIC PROTOCOL.
+
+CRITICAL: You are NOT just mapping data. You are VALIDATING if the site meets protocol requirements.
+
+PROTOCOL REQUIREMENTS:
+{requirements_summary}
+
+SITE CAPABILITIES:
+{site_summary}
+
+YOUR TASK: VALIDATE if the site can meet protocol requirements. You are a FEASIBILITY ASSESSOR, not a data retriever.
+"""
+
+    def _map_single_question_with_ai(self, question: Dict, site_summary: str, site_profile: Dict,
+                                     prompt_prefix: Optional[str] = None) -> Optional[AIQuestionMapping]:
+        """
+        Use AI to validate if site meets protocol requirements for this question.
+        `prompt_prefix` is the shared _build_protocol_prompt_prefix output; built here if omitted.
         """
         question_text = question.get('text', '')
         question_id = question.get('id', '')
@@ -626,30 +1112,24 @@ Return JSON format:
 
         # QUESTION TYPE DETECTION - Handle before AI call
         # Type 1: DIRECT VALUE QUESTIONS - Return protocol/site values directly
-        import re
-
         # Pattern matching for "What is..." questions
         what_is_match = re.match(r'^what\s+is\s+(the\s+)?(.+)\??$', text_lower)
         if what_is_match:
             # Extract what they're asking about
             asking_about = what_is_match.group(2).strip()
+            tokens, bigrams = _keyword_tokens(asking_about)
 
             # PRIORITY 1: Check for SPECIFIC participant count questions FIRST (most specific)
-            if 'number' in asking_about and 'participant' in asking_about:
+            if 'number' in tokens and 'participant' in tokens:
                 enrollment_target = protocol_requirements.get('study_timeline', {}).get('enrollment_target')
                 if enrollment_target:
-                    return AIQuestionMapping(
-                        question_id=question_id,
-                        question_text=question_text,
-                        mapped_field='enrollment_target',
-                        mapped_value=f'{enrollment_target} patients',
-                        confidence_score=0.95,
-                        source='protocol_direct',
-                        reasoning=f'Direct protocol data: enrollment target is {enrollment_target} patients'
+                    return self._direct(
+                        question, 'enrollment_target', f'{enrollment_target} patients',
+                        f'Direct protocol data: enrollment target is {enrollment_target} patients'
                     )
 
             # PRIORITY 2: Check for health status questions (specific)
-            if 'health status' in asking_about or 'participant health' in asking_about:
+            if 'health status' in bigrams or 'participant health' in bigrams:
                 indication = protocol_requirements.get('patient_population', {}).get('primary_indication')
                 inclusion = protocol_requirements.get('patient_population', {}).get('key_inclusion_criteria', [])
                 if indication:
@@ -657,155 +1137,104 @@ Return JSON format:
                     health_status = indication
                     if inclusion:
                         health_status += f" ({', '.join(inclusion[:2])})"
-                    return AIQuestionMapping(
-                        question_id=question_id,
-                        question_text=question_text,
-                        mapped_field='patient_health_status',
-                        mapped_value=health_status,
-                        confidence_score=0.95,
-                        source='protocol_direct',
-                        reasoning=f'Direct protocol data: patient health status is {health_status}'
+                    return self._direct(
+                        question, 'patient_health_status', health_status,
+                        f'Direct protocol data: patient health status is {health_status}'
                     )
 
             # Check protocol data for other questions
-            if 'phase' in asking_about:
+            if 'phase' in tokens:
                 phase = protocol_requirements.get('study_identification', {}).get('phase')
                 if phase:
-                    return AIQuestionMapping(
-                        question_id=question_id,
-                        question_text=question_text,
-                        mapped_field='protocol_phase',
-                        mapped_value=phase,
-                        confidence_score=0.95,
-                        source='protocol_direct',
-                        reasoning=f'Direct protocol data: phase is {phase}'
+                    return self._direct(
+                        question, 'protocol_phase', phase,
+                        f'Direct protocol data: phase is {phase}'
                     )
 
-            if 'duration' in asking_about or 'long' in asking_about:
+            if 'duration' in tokens or 'long' in tokens:
                 weeks = protocol_requirements.get('study_timeline', {}).get('total_duration_weeks')
                 if weeks:
-                    return AIQuestionMapping(
-                        question_id=question_id,
-                        question_text=question_text,
-                        mapped_field='study_duration',
-                        mapped_value=f'{weeks} weeks ({weeks/4:.1f} months)',
-                        confidence_score=0.95,
-                        source='protocol_direct',
-                        reasoning=f'Direct protocol data: study duration is {weeks} weeks'
+                    return self._direct(
+                        question, 'study_duration', f'{weeks} weeks ({weeks/4:.1f} months)',
+                        f'Direct protocol data: study duration is {weeks} weeks'
                     )
 
             # PRIORITY 3: Population AGE questions (general population info, not count)
-            if ('population age' in asking_about or 'age range' in asking_about or
-                ('population' in asking_about and 'number' not in asking_about)):
+            if ('population age' in bigrams or 'age range' in bigrams or
+                ('population' in tokens and 'number' not in tokens)):
                 indication = protocol_requirements.get('patient_population', {}).get('primary_indication')
                 age_min = protocol_requirements.get('patient_population', {}).get('age_min')
                 age_max = protocol_requirements.get('patient_population', {}).get('age_max')
                 if indication or (age_min and age_max):
                     # If asking specifically about age, return just age
-                    if 'age' in asking_about:
+                    if 'age' in tokens:
                         if age_min and age_max:
-                            return AIQuestionMapping(
-                                question_id=question_id,
-                                question_text=question_text,
-                                mapped_field='population_age',
-                                mapped_value=f'{age_min}-{age_max} years',
-                                confidence_score=0.95,
-                                source='protocol_direct',
-                                reasoning=f'Direct protocol data: population age range is {age_min}-{age_max} years'
+                            return self._direct(
+                                question, 'population_age', f'{age_min}-{age_max} years',
+                                f'Direct protocol data: population age range is {age_min}-{age_max} years'
                             )
                     # Otherwise return indication with age
                     elif indication:
                         age_str = f', ages {age_min}-{age_max}' if age_min and age_max else ''
-                        return AIQuestionMapping(
-                            question_id=question_id,
-                            question_text=question_text,
-                            mapped_field='patient_population',
-                            mapped_value=f'{indication}{age_str}',
-                            confidence_score=0.95,
-                            source='protocol_direct',
-                            reasoning=f'Direct protocol data: population is {indication}'
+                        return self._direct(
+                            question, 'patient_population', f'{indication}{age_str}',
+                            f'Direct protocol data: population is {indication}'
                         )
 
-            if 'therapeutic area' in asking_about or 'indication' in asking_about:
+            if 'therapeutic area' in bigrams or 'indication' in tokens:
                 therapeutic_area = protocol_requirements.get('study_identification', {}).get('therapeutic_area')
                 if therapeutic_area:
-                    return AIQuestionMapping(
-                        question_id=question_id,
-                        question_text=question_text,
-                        mapped_field='therapeutic_area',
-                        mapped_value=therapeutic_area,
-                        confidence_score=0.95,
-                        source='protocol_direct',
-                        reasoning=f'Direct protocol data: therapeutic area is {therapeutic_area}'
+                    return self._direct(
+                        question, 'therapeutic_area', therapeutic_area,
+                        f'Direct protocol data: therapeutic area is {therapeutic_area}'
                     )
 
-            if 'sponsor' in asking_about:
+            if 'sponsor' in tokens:
                 sponsor = protocol_requirements.get('study_identification', {}).get('sponsor_name')
                 if sponsor:
-                    return AIQuestionMapping(
-                        question_id=question_id,
-                        question_text=question_text,
-                        mapped_field='sponsor_name',
-                        mapped_value=sponsor,
-                        confidence_score=0.95,
-                        source='protocol_direct',
-                        reasoning=f'Direct protocol data: sponsor is {sponsor}'
+                    return self._direct(
+                        question, 'sponsor_name', sponsor,
+                        f'Direct protocol data: sponsor is {sponsor}'
                     )
 
         # Type 2: HOW MANY - Return numeric values
         how_many_match = re.match(r'^how\s+many\s+(.+)\??$', text_lower)
         if how_many_match:
             asking_about = how_many_match.group(1).strip()
+            tokens, bigrams = _keyword_tokens(asking_about)
 
             # Check for time/hour questions first
-            if 'hour' in asking_about:
-                return AIQuestionMapping(
-                    question_id=question_id,
-                    question_text=question_text,
-                    mapped_field='time_estimation',
-                    mapped_value='Unable to determine specific hours without detailed protocol analysis',
-                    confidence_score=0.6,
-                    source='time_estimation',
-                    reasoning='Time estimation question - requires detailed protocol review to provide accurate hours'
+            if 'hour' in tokens:
+                return self._direct(
+                    question, 'time_estimation', 'Unable to determine specific hours without detailed protocol analysis',
+                    'Time estimation question - requires detailed protocol review to provide accurate hours',
+                    confidence=0.6, source='time_estimation'
                 )
 
-            if 'participant' in asking_about or 'patient' in asking_about or 'subject' in asking_about:
+            if 'participant' in tokens or 'patient' in tokens or 'subject' in tokens:
                 enrollment_target = protocol_requirements.get('study_timeline', {}).get('enrollment_target')
                 if enrollment_target:
-                    return AIQuestionMapping(
-                        question_id=question_id,
-                        question_text=question_text,
-                        mapped_field='enrollment_target',
-                        mapped_value=f'{enrollment_target} patients',
-                        confidence_score=0.95,
-                        source='protocol_direct',
-                        reasoning=f'Direct protocol data: enrollment target is {enrollment_target} patients'
+                    return self._direct(
+                        question, 'enrollment_target', f'{enrollment_target} patients',
+                        f'Direct protocol data: enrollment target is {enrollment_target} patients'
                     )
 
-            if 'coordinator' in asking_about:
+            if 'coordinator' in tokens:
                 coord_count = site_profile.get('staff_and_experience', {}).get('coordinators', {}).get('count')
                 if coord_count:
-                    return AIQuestionMapping(
-                        question_id=question_id,
-                        question_text=question_text,
-                        mapped_field='coordinator_count',
-                        mapped_value=f'{coord_count} coordinators',
-                        confidence_score=0.95,
-                        source='site_direct',
-                        reasoning=f'Direct site data: {coord_count} coordinators available'
+                    return self._direct(
+                        question, 'coordinator_count', f'{coord_count} coordinators',
+                        f'Direct site data: {coord_count} coordinators available',
+                        source='site_direct'
                     )
 
-            if 'investigator' in asking_about or 'pi' in asking_about:
+            if 'investigator' in tokens or 'pi' in tokens:
                 inv_count = site_profile.get('staff_and_experience', {}).get('investigators', {}).get('count')
                 if inv_count:
-                    return AIQuestionMapping(
-                        question_id=question_id,
-                        question_text=question_text,
-                        mapped_field='investigator_count',
-                        mapped_value=f'{inv_count} investigators',
-                        confidence_score=0.95,
-                        source='site_direct',
-                        reasoning=f'Direct site data: {inv_count} investigators available'
+                    return self._direct(
+                        question, 'investigator_count', f'{inv_count} investigators',
+                        f'Direct site data: {inv_count} investigators available',
+                        source='site_direct'
                     )
 
         # Type 3: BINARY CHOICE QUESTIONS - Choose one option
@@ -817,250 +1246,47 @@ Return JSON format:
             # For clinical vs academic question
             if 'clinical' in text_lower and 'academic' in text_lower:
                 # Default to Clinical for industry-sponsored trials
-                return AIQuestionMapping(
-                    question_id=question_id,
-                    question_text=question_text,
-                    mapped_field='study_type',
-                    mapped_value='Clinical',
-                    confidence_score=0.8,
-                    source='binary_choice',
-                    reasoning='Industry-sponsored protocols are typically for clinical reasons'
+                return self._direct(
+                    question, 'study_type', 'Clinical',
+                    'Industry-sponsored protocols are typically for clinical reasons',
+                    confidence=0.8, source='binary_choice'
                 )
 
         # Type 4: CAPABILITY/GAP ANALYSIS QUESTIONS - Pass to AI for validation
         # Questions starting with "Do", "Does", "Is", "Are", "Can" need gap analysis
-        equipment_required = protocol_requirements.get('equipment_required', [])
-        staff_requirements = protocol_requirements.get('staff_requirements', [])
-        patient_criteria = protocol_requirements.get('patient_criteria', {})
-        procedures = protocol_requirements.get('procedures', [])
-
-        requirements_summary = self._format_protocol_requirements(protocol_requirements)
-
-        prompt = f"""You are a FEASIBILITY ASSESSOR checking if this site can run THIS SPECIFIC PROTOCOL.
-
-CRITICAL: You are NOT just mapping data. You are VALIDATING if the site meets protocol requirements.
-
+        if prompt_prefix is None:
+            prompt_prefix = self._build_protocol_prompt_prefix(site_summary, site_profile)
+        # Provenance comes from the rubric used, not the model's reply: the
+        # strict mapping schema has no `source` field for it to fill in
+        if protocol_requirements:
+            system_message, source = VALIDATION_SYSTEM_MESSAGE, 'requirement_validation'
+        else:
+            system_message, source = SITE_ONLY_SYSTEM_MESSAGE, 'site_profile'
+        prompt = f"""{prompt_prefix}
 QUESTION: "{question_text}"
-
-PROTOCOL REQUIREMENTS:
-{requirements_summary}
-
-SITE CAPABILITIES:
-{site_summary}
-
-YOUR TASK: VALIDATE if the site can meet protocol requirements. You are a FEASIBILITY ASSESSOR, not a data retriever.
-
-QUESTION TYPE DETECTION:
-1. **Numeric questions** (What is..., How many..., How long...) → Return the NUMBER or VALUE from protocol/site
-   - "What is the phase?" → "Phase III" (not "Yes, site can conduct Phase III")
-   - "How many coordinators?" → "5 coordinators" (not "Yes, adequate staff")
-
-2. **List questions** (What procedures/equipment/departments...) → Return COMMA-SEPARATED LIST
-   - "What procedures will be performed?" → "Liver biopsy, MRI-PDFF, FibroScan, ECG"
-   - "What departments are required?" → "Hepatology, Radiology, Pharmacy, Laboratory"
-   - DO NOT answer with "Yes, site can..." for list questions
-
-3. **Binary choice questions** (X or Y?) → Choose ONE option, not Yes/No
-   - "Clinical or Academic?" → "Clinical" or "Academic" (not "Yes, site meets...")
-   - Return the most appropriate option from the choices given
-
-4. **Capability questions** (Is..., Does..., Can...) → Validate if site meets requirements
-   - "Is equipment available?" → "Yes, site has FibroScan" OR "No, site lacks FibroScan"
-
-CRITICAL - INVERTED QUESTION LOGIC:
-⚠️ When questions ask "Are X needed?" or "Is X necessary?", the logic is INVERTED:
-- If site LACKS the requirement → Answer "Yes, need [specific requirement]"
-- If site HAS the requirement → Answer "No, site has [capability]"
-
-CORRECT INVERTED LOGIC EXAMPLES:
-Q: "Are additional specialists needed?"
-Protocol needs: Hepatology PI
-Site has: Cardiology PI only
-✅ CORRECT: "Yes, need PI with hepatology specialization"
-❌ WRONG: "No, site lacks hepatology PI"
-
-Q: "Is additional training necessary?"
-Protocol needs: ACLS certification
-Site has: GCP only
-✅ CORRECT: "Yes, need ACLS certification training"
-❌ WRONG: "No, additional training is necessary"
-
-Q: "Are additional specialists needed?"
-Protocol needs: Hepatology PI
-Site has: Dr. Jane Doe (Hepatology PI)
-✅ CORRECT: "No, site has hepatology PI (Dr. Jane Doe)"
-❌ WRONG: "Yes, all specialists available"
-
-REQUIREMENT VALIDATION LOGIC:
-1. **Identify what type of question this is** (numeric vs capability)
-2. **For numeric questions**: Return the specific value from protocol or site data
-3. **For capability questions**: Compare protocol requirements to site capabilities
-4. **Answer naturally and accurately**:
-   - Numeric answer: "Phase III", "48 weeks", "30 patients", "5 coordinators"
-   - Capability match: "Yes, [specific reason]"
-   - Capability gap: "No, [specific gap]"
-   - Uncertain: "Unable to determine [what's missing]"
-   - Partial: "Partially - [what's available and what's missing]"
-
-VALIDATION EXAMPLES:
-
-Example 1 - Clear Gap (Staff):
-Q: "Does the site have adequate staff to conduct this study?"
-Protocol Needs: PI with hepatology experience (0.3 FTE), FibroScan trained coordinator
-Site Has: 3 PIs (Cardiology, Oncology, Endocrinology), 5 coordinators (GCP certified)
-CORRECT Answer: "No, site lacks PI with hepatology experience and FibroScan trained personnel"
-WRONG Answer: "Yes - 3 PIs and 5 coordinators available" ❌
-
-Example 2 - Partial Match (Equipment):
-Q: "Is specialized equipment required for this study available?"
-Protocol Needs: [CRITICAL] FibroScan device, [CRITICAL] MRI with PDFF capability
-Site Has: MRI (1.5T standard), CT Scanner, Ultrasound
-CORRECT Answer: "Partially - site has MRI but not with PDFF capability, and lacks FibroScan device"
-WRONG Answer: "Yes - MRI and imaging equipment available" ❌
-
-Example 3 - Clear Match (Population):
-Q: "Do you have access to the required patient population?"
-Protocol Needs: NASH patients with F2-F3 fibrosis, 8-12 patients over 12 months
-Site Has: 450 NASH patients annually, established screening program
-CORRECT Answer: "Yes, site has 450 NASH patients annually and can easily meet 8-12 patient requirement"
-WRONG Answer: "450 patients available" (not a clear answer) ❌
-
-Example 4 - Insufficient Information:
-Q: "Can site support the required visit schedule?"
-Protocol Needs: [Information not provided in protocol]
-Site Has: Flexible scheduling, experienced coordinators
-CORRECT Answer: "Unable to determine without protocol's specific visit schedule requirements"
-WRONG Answer: "Yes - site has flexible scheduling" ❌
-
-DIRECT PROTOCOL DATA MAPPING:
-When survey questions ask about protocol details, use extracted protocol data:
-
-Example 5 - Protocol Phase:
-Q: "What is the protocol phase?"
-Protocol: Phase III
-CORRECT Answer: "Phase III"
-WRONG Answer: "Yes, site can conduct Phase III trials" ❌
-
-Example 6 - Study Duration:
-Q: "What is the duration of the study?"
-Protocol: 48 weeks total duration
-CORRECT Answer: "48 weeks (12 months)"
-WRONG Answer: "Site can support long studies" ❌
-
-Example 7 - Enrollment Target:
-Q: "How many patients need to be enrolled?"
-Protocol: Enrollment target 30 patients
-CORRECT Answer: "30 patients"
-WRONG Answer: "Site has capacity for enrollment" ❌
-
-Example 8 - Sponsor Name:
-Q: "Who is the sponsor?"
-Protocol: Sponsor - Novartis Pharmaceuticals
-CORRECT Answer: "Novartis Pharmaceuticals"
-WRONG Answer: "Site has worked with major sponsors" ❌
-
-Example 9 - List Questions:
-Q: "What procedures will be performed?"
-Protocol: Liver biopsy, MRI-PDFF, FibroScan, ECG, blood sampling
-CORRECT Answer: "Liver biopsy, MRI-PDFF, FibroScan, ECG, blood sampling"
-WRONG Answer: "Yes, site can perform all required procedures" ❌
-
-Example 10 - List Questions (Departments):
-Q: "What departments/services are required?"
-Protocol: Hepatology clinic, Radiology, Clinical pharmacy, Central lab
-CORRECT Answer: "Hepatology, Radiology, Pharmacy, Laboratory"
-WRONG Answer: "Yes, coordination with other departments will be required" ❌
-
-Example 11 - Binary Choice Questions:
-Q: "Is this study for Clinical Reasons or Academic?"
-Protocol: Industry-sponsored Phase II trial
-CORRECT Answer: "Clinical"
-WRONG Answer: "Yes, site meets all protocol requirements" ❌
-
-Response format - return ONLY valid JSON:
-{{
-    "mapped_field": "requirement category being validated (e.g., 'staff_requirements', 'equipment_required')",
-    "mapped_value": "Natural answer: 'Yes, [reason]' OR 'No, [gap]' OR 'Partially - [details]' OR 'Unable to determine [what's needed]'",
-    "confidence_score": 0.0-1.0 (high if clear match/mismatch, medium for partial, low for uncertain),
-    "reasoning": "Requirement validation logic: what protocol needs vs what site has",
-    "source": "requirement_validation"
-}}
-
-REQUIREMENT VALIDATION PATTERNS:
-
-STAFF VALIDATION:
-- "Adequate staff?" → Compare protocol's specific staff needs (PI specialty, coordinator training, FTE) to site's actual staff
-  Example: Protocol needs "PI with hepatology" → Check if ANY site PI has hepatology specialty
-- "PI qualified?" → Verify PI specialty matches protocol's therapeutic area
-- "Coordinator experience?" → Check if coordinators have protocol-specific training (GCP, device-specific, etc.)
-
-EQUIPMENT VALIDATION:
-- "Equipment available?" → Check if EVERY piece of critical equipment in protocol is available at site
-  Example: Protocol needs "FibroScan" → Answer "No" if site only has standard imaging
-- "Special procedures possible?" → Validate site can perform protocol-specific procedures
-- "Lab capabilities sufficient?" → Ensure lab certifications match protocol requirements
-
-POPULATION VALIDATION:
-- "Access to population?" → Verify site has protocol's SPECIFIC patient type AND volume
-  Example: Protocol needs "NASH F2-F3" → Check if site has NASH patients with fibrosis staging capability
-- "Enrollment feasible?" → Compare protocol's target enrollment to site's actual patient volume
-- "Age criteria met?" → Verify site's patient age range covers protocol's requirements
-
-EXPERIENCE VALIDATION:
-- "Prior experience?" → Check if site has run studies in protocol's EXACT therapeutic area
-  Example: Protocol is NASH Phase II → Check for prior NASH or hepatology experience (not just general GI)
-- "Phase experience?" → Verify site has conducted studies at protocol's phase level
-
-CRITICAL REQUIREMENT VALIDATION RULES:
-
-1. **ALWAYS compare protocol to site** - Never just list what site has
-   ❌ WRONG: "Site has 3 PIs and 5 coordinators"
-   ✅ RIGHT: "No, site lacks PI with required hepatology specialty"
-
-2. **Answer naturally with appropriate format** - Don't force Yes/No when uncertain or partial
-   ❌ WRONG: "Yes" or "No" (no explanation)
-   ✅ RIGHT: "Yes, site has FibroScan and all required imaging"
-   ✅ RIGHT: "Partially - site has MRI but lacks PDFF capability"
-   ✅ RIGHT: "Unable to determine without protocol's specific visit schedule"
-
-3. **WHO questions** → Names or "Unknown", never numbers
-   ✅ "Principal Investigator Name" or "Unknown"
-   ❌ "Yes" or "5"
-
-4. **Match SPECIFIC protocol requirements**, not general capabilities
-   Example: Protocol needs "NASH patients with F2-F3 fibrosis"
-   ❌ WRONG: "Yes - 450 NASH patients available"
-   ✅ RIGHT: "Yes, 450 NASH patients with FibroScan for fibrosis staging"
-   ✅ RIGHT: "Partially - 450 NASH patients but no fibrosis staging capability"
-
-5. **Use "Partially" for partial matches** - ONE missing requirement ≠ complete "No"
-   Example: Protocol needs [CRITICAL] FibroScan + [CRITICAL] Hepatology PI
-   Site has: FibroScan but no hepatology PI
-   ✅ RIGHT: "Partially - site has FibroScan but lacks PI with hepatology specialization (critical gap)"
-   ❌ WRONG: "No" (ignores what site DOES have)
-
-6. **Provide actionable gap analysis in all answers**
-   ❌ WRONG: "No - inadequate"
-   ✅ RIGHT: "No, missing FibroScan device and hepatology-trained staff"
-   ✅ RIGHT: "Partially - has FibroScan but lacks hepatology-trained staff"
-
-EXAMPLES OF CORRECT SEMANTIC MATCHING:
-Q: "Who is the PI?" → A: "Principal Investigator Name" or "Unknown" (not "Yes" or numbers)
-Q: "Who is the sponsor?" → A: "Sponsor name to be determined" or "Unknown" (not "Yes" or booleans)
-Q: "Do you have imaging capability?" → A: "Yes" (not "MRI 1.5T, CT 64-slice")
-Q: "What imaging equipment is available?" → A: "MRI (1.5T), CT (64-slice), Ultrasound, DEXA"
-Q: "How many research coordinators?" → A: "5" (not "5 coordinators with avg 6 years experience")
-Q: "Adequate staff to conduct study?" → A: "Yes" (not "5 coordinators, 3 investigators")
 """
 
         try:
-            # Use unified client with automatic API detection and fallback
-            result = self.openai_client.create_json_completion(
-                prompt=prompt,
-                system_message="You are a CLINICAL TRIAL FEASIBILITY ASSESSOR. Your job is to VALIDATE if the site can run THIS SPECIFIC PROTOCOL by comparing protocol requirements to site capabilities. Be DECISIVE - answer Yes only if ALL requirements are met, No if ANY are missing. Provide specific gap analysis. Return only valid JSON.",
-                temperature=0.1,
-                max_tokens=3000  # High limit for gpt-5-mini reasoning + JSON output
-            )
+            # Use unified client with automatic API detection and fallback.
+            # Streams the answer and stops as soon as confidence_score comes back
+            # below the autofill threshold - that answer would be discarded anyway.
+            with _llm_call_slots:
+                result = self.openai_client.create_json_completion_with_cutoff(
+                    prompt=prompt,
+                    system_message=system_message,
+                    temperature=0.1,
+                    max_tokens=3000,  # High limit for gpt-5-mini reasoning + JSON output
+                    cutoff_field='confidence_score',
+                    cutoff_below=AUTOFILL_MIN_CONFIDENCE,
+                    model=self._model_for_question(question_text),
+                    json_schema=MAPPING_JSON_SCHEMA
+                )
+            if result is None:
+                return self._direct(
+                    question, 'unmapped', '',
+                    'AI reported low confidence - generation stopped early',
+                    confidence=0.0, source='ai_low_confidence'
+                )
 
             # POST-PROCESSING: Fix inverted logic for "Are X needed/required?" questions
             # AI often gets this backwards, so we enforce it here
@@ -1096,7 +1322,7 @@ Q: "Adequate staff to conduct study?" → A: "Yes" (not "5 coordinators, 3 inves
                 mapped_field=result.get('mapped_field', 'unmapped'),
                 mapped_value=mapped_value,  # Use post-processed value
                 confidence_score=float(result.get('confidence_score', 0.0)),
-                source=result.get('source', 'ai_mapping'),
+                source=source,
                 reasoning=reasoning  # Use post-processed reasoning
             )
 
@@ -1117,69 +1343,67 @@ Q: "Adequate staff to conduct study?" → A: "Yes" (not "5 coordinators, 3 inves
         """
         Generate autofilled responses based on AI mappings
         """
-        responses = []
+        responses: List[Optional[Dict]] = [None] * len(questions)
+
+        # Index mappings by question id once (first mapping wins, as before)
+        mapping_by_id: Dict[str, AIQuestionMapping] = {}
+        for m in mappings:
+            mapping_by_id.setdefault(m.question_id, m)
 
         for i, question in enumerate(questions):
-            question_id = question.get('id', f'q_{i+1}')
-            is_objective = question.get('is_objective', True)
+            question_id = question['id']
 
             # Subjective questions ALWAYS require manual input, regardless of mapping
-            if not is_objective:
-                response = {
-                    'id': question_id,
-                    'text': question.get('text', ''),
-                    'type': question.get('type', 'text'),
-                    'is_objective': False,
-                    'response': '',
-                    'source': 'manual_required',
-                    'confidence': 0.0,
-                    'manually_edited': False,
-                    'reasoning': 'Subjective question requires manual input'
-                }
-                responses.append(response)
+            if not question.get('is_objective', True):
+                response = _SUBJECTIVE_RESPONSE.copy()
+                response['id'] = question_id
+                response['text'] = question.get('text', '')
+                response['type'] = question.get('type', 'text')
+                responses[i] = response
                 continue
 
             # Find the corresponding mapping for objective questions
-            mapping = next((m for m in mappings if m.question_id == question_id), None)
+            mapping = mapping_by_id.get(question_id)
 
             # Check if mapping has valid answer (not "Manual review required" or similar)
             has_valid_answer = (
                 mapping and
-                mapping.confidence_score > 0.3 and
+                mapping.confidence_score > AUTOFILL_MIN_CONFIDENCE and
                 mapping.mapped_value and
-                mapping.mapped_value not in ['Manual review required', 'Requires manual review', 'No answer provided', 'Not processed']
+                mapping.mapped_value not in _NON_ANSWERS
             )
 
             if has_valid_answer:
-                response = {
-                    'id': question_id,
-                    'text': question.get('text', ''),
-                    'type': question.get('type', 'text'),
-                    'is_objective': True,
-                    'response': str(mapping.mapped_value),
-                    'source': 'ai_mapping',
-                    'confidence': mapping.confidence_score,
-                    'manually_edited': False,
-                    'reasoning': mapping.reasoning
-                }
+                value = mapping.mapped_value
+                responses[i] = self._build_response(
+                    question_id, question, True,
+                    value if isinstance(value, str) else str(value),
+                    'ai_mapping', mapping.confidence_score, mapping.reasoning
+                )
             else:
                 # Low confidence or unmapped objective question - requires manual input
-                response = {
-                    'id': question_id,
-                    'text': question.get('text', ''),
-                    'type': question.get('type', 'text'),
-                    'is_objective': True,
-                    'response': '',
-                    'source': 'manual_required',
-                    'confidence': 0.0,
-                    'manually_edited': False,
-                    'reasoning': mapping.reasoning if mapping else 'No mapping found'
-                }
-
-            responses.append(response)
+                responses[i] = self._build_response(
+                    question_id, question, True, '', 'manual_required', 0.0,
+                    mapping.reasoning if mapping else 'No mapping found'
+                )
 
         return responses
 
+    @staticmethod
+    def _build_response(question_id: str, question: Dict, is_objective: bool, response: str,
+                        source: str, confidence: float, reasoning: str) -> Dict:
+        return {
+            'id': question_id,
+            'text': question.get('text', ''),
+            'type': question.get('type', 'text'),
+            'is_objective': is_objective,
+            'response': response,
+            'source': source,
+            'confidence': confidence,
+            'manually_edited': False,
+            'reasoning': reasoning
+        }
+
     def get_mapping_statistics(self, mappings: List[AIQuestionMapping]) -> Dict[str, Any]:
         """
         Generate statistics about the AI mapping quality
@@ -1188,11 +1412,13 @@ Q: "Adequate staff to conduct study?" → A: "Yes" (not "5 coordinators, 3 inves
         if total_mappings == 0:
             return {"total_mappings": 0, "average_confidence": 0.0}
 
-        high_confidence = sum(1 for m in mappings if m.confidence_score >= 0.8)
-        medium_confidence = sum(1 for m in mappings if 0.6 <= m.confidence_score < 0.8)
-        low_confidence = sum(1 for m in mappings if m.confidence_score < 0.6)
+        # One pass to pull scores out of the objects, then vectorized bucket counts
+        confidences = np.fromiter((m.confidence_score for m in mappings), dtype=np.float64, count=total_mappings)
+        high_confidence = int(np.count_nonzero(confidences >= 0.8))
+        low_confidence = int(np.count_nonzero(confidences < 0.6))
+        medium_confidence = total_mappings - high_confidence - low_confidence
 
-        avg_confidence = sum(m.confidence_score for m in mappings) / total_mappings
+        avg_confidence = float(confidences.mean())
 
         return {
             "total_mappings": total_mappings,
@@ -1,31 +1,38 @@
 from typing import Any, Dict
 from sqlalchemy.orm import Session
 from app import models
-from app.services.scoring import score_protocol_for_site, load_site_truth_map, parse_value, evaluate_rule
+from app.services.scoring import (
+    score_protocol_for_site, load_site_truth_map, parse_value, evaluate_rule, lookup_truth_value
+)
 
 def build_autofill_draft(db: Session, protocol_id: int, site_id: int) -> Dict[str, Any]:
     """Propose answers for objective items; flag subjective and missing."""
-    res = score_protocol_for_site(db, protocol_id, site_id)
+    # Load requirements and site truth once and share them with the scorer
+    prot_reqs = db.query(models.ProtocolRequirement).filter(models.ProtocolRequirement.protocol_id == protocol_id).all()
+    tmap = load_site_truth_map(db, site_id)
+
+    res = score_protocol_for_site(db, protocol_id, site_id, reqs=prot_reqs, tmap=tmap)
     if "error" in res:
         return res
 
-    tmap = load_site_truth_map(db, site_id)
-
     objective_answers = []
     unresolved_missing = []
+    objective_count = 0
+    key_index: Dict = {}
 
     # For every objective requirement, if we have a site value, propose it
-    prot_reqs = db.query(models.ProtocolRequirement).filter(models.ProtocolRequirement.protocol_id == protocol_id).all()
     for r in prot_reqs:
         if r.type == "subjective":
             continue
-        site_val = tmap.get(r.key)
+        if r.type == "objective":
+            objective_count += 1
+        truth_key, site_val = lookup_truth_value(tmap, r.key, key_index)
         if site_val is not None:
             objective_answers.append({
                 "question": r.source_question or r.key,
                 "key": r.key,
                 "proposed_answer": site_val,
-                "rationale": f"From site truth field '{r.key}'",
+                "rationale": f"From site truth field '{truth_key}'",
                 "meets_requirement": evaluate_rule(r.op, parse_value(r.value), site_val)
             })
         else:
@@ -35,7 +42,7 @@ def build_autofill_draft(db: Session, protocol_id: int, site_id: int) -> Dict[st
                 "reason": "No site data found"
             })
 
-    coverage_pct = int(round(100 * (len(objective_answers) / max(1, len([r for r in prot_reqs if r.type=='objective'])))))
+    coverage_pct = int(round(100 * (len(objective_answers) / max(1, objective_count))))
 
     return {
         "score": {k: res[k] for k in ("score","confidence","total_weight")},
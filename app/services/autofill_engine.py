@@ -1,9 +1,152 @@
-from typing import Dict, List, Any
-from sqlalchemy.orm import Session
+import re
+import asyncio
+import operator
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, raiseload, selectinload
 import json
 from app import models
 from app.services.universal_survey_parser import UniversalSurveyParser, ExtractedQuestion
-from app.services.ai_question_mapper import AIQuestionMapper, AIQuestionMapping
+from app.services.ai_question_mapper import AIQuestionMapper, AIQuestionMapping, normalize_question_ids
+from app.services.comprehensive_feasibility_scorer import ComprehensiveFeasibilityScorer
+
+# ExtractedQuestion fields copied into the question dicts, fetched in one C-level call
+_question_fields = operator.attrgetter('id', 'text', 'type', 'is_objective', 'confidence_score', 'context')
+
+# Question categories for _autofill_objective_question, tried in order (first match
+# wins); one compiled alternation per category, plain substring semantics
+_OBJECTIVE_CATEGORIES = (
+    ('equipment', re.compile(r'equipment|device|machine')),
+    ('staff', re.compile(r'staff|personnel|coordinator|investigator')),
+    ('experience', re.compile(r'experience|previous|completed|enrolled')),
+    ('population', re.compile(r'patient|population|participants|subjects')),
+    ('emr', re.compile(r'emr|electronic|system|software')),
+    ('protocol', re.compile(r'phase|indication|sponsor')),
+)
+
+# Same for _intelligent_autofill; lookaheads express the "a and b" conditions
+_INTELLIGENT_CATEGORIES = (
+    ('population_access', re.compile(r'^(?=.*access)(?=.*population)', re.S)),
+    ('enrollment_rate', re.compile(r'enroll per month|^(?=.*patients)(?=.*month)', re.S)),
+    ('equipment', re.compile(r'equipment|special')),
+    ('staff', re.compile(r'staff')),
+    ('sponsor_experience', re.compile(r'^(?=.*experience)(?=.*(?:sponsor|cro))', re.S)),
+    ('budget', re.compile(r'budget')),
+)
+
+def _first_category(text: str, categories) -> Optional[str]:
+    for category, pattern in categories:
+        if pattern.search(text):
+            return category
+    return None
+
+# Shared scorer (stateless; memoizes its own results by input hash)
+_scorer = ComprehensiveFeasibilityScorer()
+
+# Response classes for _calculate_universal_feasibility_score (positive: substring match, as before)
+_UNAVAILABLE_RESPONSES = ('Information not available', 'None available')
+_POSITIVE_RESPONSE_RE = re.compile(r'yes|available|certified|experienced')
+
+# Negative answers for the capability-gap flag (word boundaries, so "notes"/"know" don't count)
+_NEGATIVE_RESPONSE_RE = re.compile(r'\b(no|not available|none)\b')
+
+@dataclass(slots=True, frozen=True)
+class SiteView:
+    """The handful of site_profile values the rule-based fallbacks read, normalized once per request"""
+    coordinators_fte: float
+    sponsors_count: int
+    annual_volume: int
+    lab_any: bool
+    lab_pk: bool
+    equipment_count: int
+    therapeutic_areas: Tuple[str, ...]
+    profile_completion: float
+
+def _build_site_view(site_profile: Dict) -> SiteView:
+    staff_resources = site_profile.get('staff_resources') or {}
+    experience_history = site_profile.get('experience_history') or {}
+    population_capabilities = site_profile.get('population_capabilities') or {}
+    lab_caps = site_profile.get('laboratory_capabilities') or {}
+    procedures_equipment = site_profile.get('procedures_equipment') or {}
+    metadata = site_profile.get('metadata') or {}
+    lab_is_dict = isinstance(lab_caps, dict)
+    return SiteView(
+        coordinators_fte=staff_resources.get('coordinators_fte') or 0,
+        sponsors_count=len(experience_history.get('previous_sponsors') or []),
+        annual_volume=population_capabilities.get('annual_patient_volume') or 0,
+        lab_any=lab_is_dict and any(lab_caps.values()),
+        lab_pk=lab_is_dict and bool(lab_caps.get('pk_sampling')),
+        equipment_count=len(procedures_equipment.get('special_equipment') or []),
+        therapeutic_areas=tuple(experience_history.get('therapeutic_areas') or []),
+        profile_completion=metadata.get('profile_completion_percentage') or 0,
+    )
+
+# Rule-based answers used when AI extraction/mapping is unavailable. Each rule is
+# (question-text matcher, handler); the first matching rule wins and its handler
+# returns (answer, confidence) from the SiteView, or None when the site has no data.
+# Matchers keep the plain substring semantics of the keyword chains they replaced.
+_FALLBACK_RULES = (
+    (re.compile(r'coordinator'),
+     lambda v: (str(v.coordinators_fte), 0.9) if v.coordinators_fte > 0 else None),
+    (re.compile(r'^(?=.*experience)(?=.*phase)', re.S),
+     lambda v: ('Yes', 0.8) if v.sponsors_count >= 2 else ('Limited experience', 0.6)),
+    (re.compile(r'patient volume|annual'),
+     lambda v: (str(v.annual_volume), 0.9) if v.annual_volume > 0 else None),
+    (re.compile(r'lab'),
+     lambda v: ('Yes', 0.8) if v.lab_any else ('Basic capabilities', 0.5)),
+    (re.compile(r'equipment|imaging'),
+     lambda v: ('Yes', 0.8) if v.equipment_count > 2 else ('Standard equipment available', 0.6)),
+)
+
+# Same idea for topping up responses the AI left unanswered; broader keywords,
+# slightly lower confidence, and no answer at all when the site has no data
+_ENHANCE_RULES = (
+    (re.compile(r'coordinator'),
+     lambda v: (str(v.coordinators_fte), 0.8) if v.coordinators_fte > 0 else None),
+    (re.compile(r'^(?=.*experience)(?=.*(?:phase|trial))|previous', re.S),
+     lambda v: ('Yes - extensive experience', 0.8) if v.sponsors_count >= 2
+     else ('Some experience', 0.6) if v.sponsors_count >= 1 else None),
+    (re.compile(r'patient|volume|annual|enrollment'),
+     lambda v: (str(v.annual_volume), 0.8) if v.annual_volume > 0 else None),
+    (re.compile(r'lab|pk|pharmacokinetic|blood|sample'),
+     lambda v: ('Yes', 0.8) if v.lab_pk else ('Basic capabilities available', 0.6) if v.lab_any else None),
+    (re.compile(r'equipment|imaging|mri|ct|scanner'),
+     lambda v: ('Yes - full equipment available', 0.8) if v.equipment_count > 2
+     else ('Standard equipment available', 0.6) if v.equipment_count else None),
+    (re.compile(r'therapeutic|disease|indication|oncology|cardiology'),
+     lambda v: (f'Yes - experience in {", ".join(v.therapeutic_areas[:3])}', 0.7)
+     if len(v.therapeutic_areas) > 2 else None),
+)
+
+def _apply_rule_based(response: Dict, rules, site_view: SiteView, source: str) -> bool:
+    """Answer `response` in place from the first matching rule; False if no rule produced an answer"""
+    q_text = response.get('text', '').lower()
+    for pattern, handler in rules:
+        if pattern.search(q_text):
+            answer = handler(site_view)
+            break
+    else:
+        return False
+
+    if answer is None:
+        return False
+    value, confidence = answer
+    response.update({
+        'response': value,
+        'source': source,
+        'confidence': confidence,
+        'manually_edited': False
+    })
+    return True
+
+def _discard_future(future: Optional[asyncio.Future]) -> None:
+    """Drop a background result nobody will await, so a failure in it is not
+    reported as "Future exception was never retrieved"."""
+    if future is None:
+        return
+    if not future.cancel() and not future.cancelled():
+        future.exception()
 
 class AutofillEngine:
     def __init__(self):
@@ -19,7 +162,15 @@ class AutofillEngine:
         """
         Universal AI-powered survey processing that works with ANY survey format
         """
+        feasibility_future = None
         try:
+            # Feasibility scoring only needs site_profile - start it on a worker thread
+            # now so it overlaps the LLM extraction/mapping below. run_in_executor submits
+            # immediately, even though the (sync) LLM calls block the event loop.
+            feasibility_future = asyncio.get_running_loop().run_in_executor(
+                None, _scorer.calculate_feasibility_score, site_profile
+            )
+
             # 1. Extract questions from document using AI
             extracted_questions = await self.survey_parser.extract_questions_from_document(
                 file_content, filename
@@ -28,15 +179,16 @@ class AutofillEngine:
             # 2. Convert to compatible format
             questions_list = [
                 {
-                    'id': q.id,
-                    'text': q.text,
-                    'type': q.type.value,
-                    'is_objective': q.is_objective,
-                    'confidence': q.confidence_score,
-                    'context': q.context
+                    'id': q_id,
+                    'text': text,
+                    'type': q_type.value,
+                    'is_objective': is_objective,
+                    'confidence': confidence,
+                    'context': context
                 }
-                for q in extracted_questions
+                for q_id, text, q_type, is_objective, confidence, context in map(_question_fields, extracted_questions)
             ]
+            normalize_question_ids(questions_list)
 
             # 3. Map questions to site profile data (BATCH PROCESSING)
             # Uses bulk_categorize_and_map() for 1-2 API calls instead of 114
@@ -59,13 +211,10 @@ class AutofillEngine:
 
             # 6. Generate completion percentage and score
             total_questions = len(questions_list)
-            autofilled_count = sum(1 for r in responses if r.get('source') != 'manual_required' and r.get('response'))
             completion_percentage = (autofilled_count / total_questions * 100) if total_questions > 0 else 0
 
-            # Use comprehensive feasibility scoring
-            from app.services.comprehensive_feasibility_scorer import ComprehensiveFeasibilityScorer
-            scorer = ComprehensiveFeasibilityScorer()
-            feasibility_result = scorer.calculate_feasibility_score(site_profile)
+            # Use comprehensive feasibility scoring (started above)
+            feasibility_result = await feasibility_future
             feasibility_score = feasibility_result.score
 
             return {
@@ -78,12 +227,13 @@ class AutofillEngine:
                 "feasibility_score": feasibility_score,
                 "categorization": categorization,
                 "mapping_statistics": mapping_stats,
-                "flags": self._generate_universal_flags(responses, site_profile),
+                "flags": self._generate_universal_flags(responses, _build_site_view(site_profile)),
                 "next_step": "Upload protocol document to enhance autofill accuracy" if autofilled_count < total_questions else "Review and submit survey"
             }
 
         except Exception as e:
             print(f"Universal survey processing error: {e}")
+            _discard_future(feasibility_future)
             # Robust fallback to simple processing with site profile data
             return await self._fallback_processing(file_content, filename, site_profile)
 
@@ -102,6 +252,7 @@ class AutofillEngine:
             site_profile: Site capabilities and profile data
             protocol_requirements: Optional protocol requirements extracted from protocol PDF
         """
+        feasibility_future = None
         try:
             if not extracted_questions:
                 return {
@@ -109,6 +260,12 @@ class AutofillEngine:
                     "error": "No questions provided",
                     "completion_percentage": 0
                 }
+            normalize_question_ids(extracted_questions)
+
+            # Scored on a worker thread while the mapping runs (see process_survey_document_universal)
+            feasibility_future = asyncio.get_running_loop().run_in_executor(
+                None, _scorer.calculate_feasibility_score, site_profile
+            )
 
             # Add protocol requirements to site_profile for AI mapper
             if protocol_requirements:
@@ -131,10 +288,8 @@ class AutofillEngine:
             autofilled_count = sum(1 for r in responses if r.get('source') != 'manual_required' and r.get('response'))
             completion_percentage = (autofilled_count / total_questions * 100) if total_questions > 0 else 0
 
-            # Calculate feasibility score using comprehensive scorer
-            from app.services.comprehensive_feasibility_scorer import ComprehensiveFeasibilityScorer
-            scorer = ComprehensiveFeasibilityScorer()
-            feasibility_result = scorer.calculate_feasibility_score(site_profile)
+            # Calculate feasibility score using comprehensive scorer (started above)
+            feasibility_result = await feasibility_future
             feasibility_score = feasibility_result.score
 
             return {
@@ -151,6 +306,7 @@ class AutofillEngine:
 
         except Exception as e:
             print(f"Error processing extracted questions: {e}")
+            _discard_future(feasibility_future)
             return {
                 "success": False,
                 "error": str(e),
@@ -166,12 +322,13 @@ class AutofillEngine:
             fallback_questions = self._generate_fallback_questions()
 
             # Map questions to site profile data using deterministic logic
-            responses = self._generate_fallback_responses(fallback_questions, site_profile)
+            responses = self._generate_fallback_responses(fallback_questions, _build_site_view(site_profile))
 
             # Calculate completion and scores
             total_questions = len(fallback_questions)
             autofilled_count = sum(1 for r in responses if r.get('response') and r.get('source') != 'manual_required')
             completion_percentage = (autofilled_count / total_questions * 100) if total_questions > 0 else 0
+            objective_questions = sum(1 for q in fallback_questions if q.get('is_objective'))
 
             return {
                 "success": True,
@@ -182,8 +339,8 @@ class AutofillEngine:
                 "completion_percentage": completion_percentage,
                 "feasibility_score": 75,  # Conservative score for fallback
                 "categorization": {
-                    "objective_questions": sum(1 for q in fallback_questions if q.get('is_objective')),
-                    "subjective_questions": sum(1 for q in fallback_questions if not q.get('is_objective'))
+                    "objective_questions": objective_questions,
+                    "subjective_questions": total_questions - objective_questions
                 },
                 "mapping_statistics": {"fallback_mode": True, "mapped_questions": autofilled_count},
                 "flags": ["Processed in fallback mode - limited AI features"],
@@ -253,131 +410,25 @@ class AutofillEngine:
             }
         ]
 
-    def _generate_fallback_responses(self, questions: List[Dict], site_profile: Dict) -> List[Dict]:
+    def _generate_fallback_responses(self, questions: List[Dict], site_view: SiteView) -> List[Dict]:
         """Generate responses using site profile data without AI"""
         responses = []
 
         for question in questions:
-            q_text = question.get('text', '').lower()
             response = dict(question)  # Copy question data
-
-            # Coordinator questions
-            if 'coordinator' in q_text:
-                staff_resources = site_profile.get('staff_resources') or {}
-                coordinators_fte = staff_resources.get('coordinators_fte') or 0
-                if coordinators_fte and coordinators_fte > 0:
-                    response.update({
-                        'response': str(coordinators_fte),
-                        'source': 'site_profile',
-                        'confidence': 0.9,
-                        'manually_edited': False
-                    })
-                else:
-                    response.update({
-                        'response': '',
-                        'source': 'manual_required',
-                        'confidence': 0.0,
-                        'manually_edited': False
-                    })
-
-            # Experience questions
-            elif 'experience' in q_text and 'phase' in q_text:
-                experience = site_profile.get('experience_history', {})
-                sponsors = experience.get('previous_sponsors', [])
-                if len(sponsors) >= 2:
-                    response.update({
-                        'response': 'Yes',
-                        'source': 'site_profile',
-                        'confidence': 0.8,
-                        'manually_edited': False
-                    })
-                else:
-                    response.update({
-                        'response': 'Limited experience',
-                        'source': 'site_profile',
-                        'confidence': 0.6,
-                        'manually_edited': False
-                    })
-
-            # Patient volume questions
-            elif 'patient volume' in q_text or 'annual' in q_text:
-                population_capabilities = site_profile.get('population_capabilities') or {}
-                volume = population_capabilities.get('annual_patient_volume') or 0
-                if volume and volume > 0:
-                    response.update({
-                        'response': str(volume),
-                        'source': 'site_profile',
-                        'confidence': 0.9,
-                        'manually_edited': False
-                    })
-                else:
-                    response.update({
-                        'response': '',
-                        'source': 'manual_required',
-                        'confidence': 0.0,
-                        'manually_edited': False
-                    })
-
-            # Laboratory questions
-            elif 'laboratory' in q_text or 'lab' in q_text:
-                lab_caps = site_profile.get('laboratory_capabilities', {})
-                if isinstance(lab_caps, dict) and any(lab_caps.values()):
-                    response.update({
-                        'response': 'Yes',
-                        'source': 'site_profile',
-                        'confidence': 0.8,
-                        'manually_edited': False
-                    })
-                else:
-                    response.update({
-                        'response': 'Basic capabilities',
-                        'source': 'site_profile',
-                        'confidence': 0.5,
-                        'manually_edited': False
-                    })
-
-            # Equipment questions
-            elif 'equipment' in q_text or 'imaging' in q_text:
-                procedures_equipment = site_profile.get('procedures_equipment') or {}
-                equipment = procedures_equipment.get('special_equipment') or []
-                if equipment and len(equipment) > 2:
-                    response.update({
-                        'response': 'Yes',
-                        'source': 'site_profile',
-                        'confidence': 0.8,
-                        'manually_edited': False
-                    })
-                else:
-                    response.update({
-                        'response': 'Standard equipment available',
-                        'source': 'site_profile',
-                        'confidence': 0.6,
-                        'manually_edited': False
-                    })
-
-            # Subjective questions
-            elif not question.get('is_objective', True):
+            # Unmatched, subjective or no-data questions require manual input
+            if not _apply_rule_based(response, _FALLBACK_RULES, site_view, 'site_profile'):
                 response.update({
                     'response': '',
                     'source': 'manual_required',
                     'confidence': 0.0,
                     'manually_edited': False
                 })
-
-            # Default for unmatched questions
-            else:
-                response.update({
-                    'response': '',
-                    'source': 'manual_required',
-                    'confidence': 0.0,
-                    'manually_edited': False
-                })
-
             responses.append(response)
 
         return responses
 
-    def _enhance_responses_with_fallback(self, responses: List[Dict], site_profile: Dict) -> List[Dict]:
+    def _enhance_responses_with_fallback(self, responses: List[Dict], site_view: SiteView) -> List[Dict]:
         """
         Enhance responses using the same logic as fallback processing for questions that weren't autofilled
         """
@@ -390,106 +441,13 @@ class AutofillEngine:
                 continue
 
             # Apply fallback mapping logic
-            q_text = response.get('text', '').lower()
             enhanced_response = dict(response)  # Copy existing response
-
-            # Coordinator questions
-            if 'coordinator' in q_text:
-                staff_resources = site_profile.get('staff_resources') or {}
-                coordinators_fte = staff_resources.get('coordinators_fte') or 0
-                if coordinators_fte and coordinators_fte > 0:
-                    enhanced_response.update({
-                        'response': str(coordinators_fte),
-                        'source': 'site_profile_fallback',
-                        'confidence': 0.8,
-                        'manually_edited': False
-                    })
-
-            # Experience questions
-            elif ('experience' in q_text and ('phase' in q_text or 'trial' in q_text)) or 'previous' in q_text:
-                experience = site_profile.get('experience_history', {})
-                sponsors = experience.get('previous_sponsors', [])
-                if len(sponsors) >= 2:
-                    enhanced_response.update({
-                        'response': 'Yes - extensive experience',
-                        'source': 'site_profile_fallback',
-                        'confidence': 0.8,
-                        'manually_edited': False
-                    })
-                elif len(sponsors) >= 1:
-                    enhanced_response.update({
-                        'response': 'Some experience',
-                        'source': 'site_profile_fallback',
-                        'confidence': 0.6,
-                        'manually_edited': False
-                    })
-
-            # Patient volume questions
-            elif any(word in q_text for word in ['patient', 'volume', 'annual', 'enrollment']):
-                population_capabilities = site_profile.get('population_capabilities') or {}
-                volume = population_capabilities.get('annual_patient_volume') or 0
-                if volume and volume > 0:
-                    enhanced_response.update({
-                        'response': str(volume),
-                        'source': 'site_profile_fallback',
-                        'confidence': 0.8,
-                        'manually_edited': False
-                    })
-
-            # Laboratory/PK questions
-            elif any(word in q_text for word in ['laboratory', 'lab', 'pk', 'pharmacokinetic', 'blood', 'sample']):
-                lab_caps = site_profile.get('laboratory_capabilities', {})
-                if isinstance(lab_caps, dict) and lab_caps.get('pk_sampling'):
-                    enhanced_response.update({
-                        'response': 'Yes',
-                        'source': 'site_profile_fallback',
-                        'confidence': 0.8,
-                        'manually_edited': False
-                    })
-                elif isinstance(lab_caps, dict) and any(lab_caps.values()):
-                    enhanced_response.update({
-                        'response': 'Basic capabilities available',
-                        'source': 'site_profile_fallback',
-                        'confidence': 0.6,
-                        'manually_edited': False
-                    })
-
-            # Equipment questions
-            elif any(word in q_text for word in ['equipment', 'imaging', 'mri', 'ct', 'scanner']):
-                procedures_equipment = site_profile.get('procedures_equipment') or {}
-                equipment = procedures_equipment.get('special_equipment') or []
-                if equipment and len(equipment) > 2:
-                    enhanced_response.update({
-                        'response': 'Yes - full equipment available',
-                        'source': 'site_profile_fallback',
-                        'confidence': 0.8,
-                        'manually_edited': False
-                    })
-                elif equipment:
-                    enhanced_response.update({
-                        'response': 'Standard equipment available',
-                        'source': 'site_profile_fallback',
-                        'confidence': 0.6,
-                        'manually_edited': False
-                    })
-
-            # Therapeutic area questions
-            elif any(word in q_text for word in ['therapeutic', 'disease', 'indication', 'oncology', 'cardiology']):
-                experience_history = site_profile.get('experience_history') or {}
-                areas = experience_history.get('therapeutic_areas') or []
-                if areas and len(areas) > 2:
-                    enhanced_response.update({
-                        'response': f'Yes - experience in {", ".join(areas[:3])}',
-                        'source': 'site_profile_fallback',
-                        'confidence': 0.7,
-                        'manually_edited': False
-                    })
-
+            _apply_rule_based(enhanced_response, _ENHANCE_RULES, site_view, 'site_profile_fallback')
             enhanced_responses.append(enhanced_response)
 
         return enhanced_responses
 
-    def _calculate_universal_feasibility_score(self, responses: List[Dict], site_profile: Dict) -> int:
+    def _calculate_universal_feasibility_score(self, responses: List[Dict], site_view: SiteView) -> int:
         """
         Calculate feasibility score based on AI-generated responses
         """
@@ -504,7 +462,7 @@ class AutofillEngine:
             response_value = response.get('response', '')
 
             # Score based on response quality and confidence
-            if response_value and response_value not in ['Information not available', 'None available']:
+            if response_value and response_value not in _UNAVAILABLE_RESPONSES:
                 if confidence >= 0.8:
                     score = 95
                 elif confidence >= 0.6:
@@ -513,7 +471,7 @@ class AutofillEngine:
                     score = 75
 
                 # Boost for positive responses
-                if any(positive in str(response_value).lower() for positive in ['yes', 'available', 'certified', 'experienced']):
+                if _POSITIVE_RESPONSE_RE.search(str(response_value).lower()):
                     score += 5
 
                 total_score += score * confidence
@@ -522,36 +480,41 @@ class AutofillEngine:
         base_score = int(total_score / weight_sum) if weight_sum > 0 else 70
 
         # Adjust based on site profile completeness
-        metadata = site_profile.get('metadata') or {}
-        profile_completeness = (metadata.get('profile_completion_percentage') or 0) / 100
+        profile_completeness = site_view.profile_completion / 100
         adjusted_score = base_score * (0.7 + 0.3 * profile_completeness)
 
         return min(100, max(40, int(adjusted_score)))
 
-    def _generate_universal_flags(self, responses: List[Dict], site_profile: Dict) -> List[str]:
+    def _generate_universal_flags(self, responses: List[Dict], site_view: SiteView) -> List[str]:
         """
         Generate warning flags based on AI analysis
         """
         flags = []
 
+        # One pass over the responses for all three counters
+        low_confidence_count = no_data_count = negative_responses = 0
+        for r in responses:
+            if r.get('is_objective') and r.get('confidence', 0) < 0.6:
+                low_confidence_count += 1
+            if r.get('source') == 'no_data_available':
+                no_data_count += 1
+            if _NEGATIVE_RESPONSE_RE.search(str(r.get('response', '')).lower()):
+                negative_responses += 1
+
         # Check for low confidence responses
-        low_confidence_count = sum(1 for r in responses if r.get('confidence', 0) < 0.6 and r.get('is_objective'))
         if low_confidence_count > 0:
             flags.append(f"{low_confidence_count} questions have low confidence scores")
 
         # Check for missing data
-        no_data_count = sum(1 for r in responses if r.get('source') == 'no_data_available')
         if no_data_count > 0:
             flags.append(f"{no_data_count} questions lack site profile data")
 
         # Check for capability concerns
-        negative_responses = sum(1 for r in responses if 'no' in str(r.get('response', '')).lower() or 'not available' in str(r.get('response', '')).lower())
         if negative_responses > len(responses) * 0.3:  # More than 30% negative
             flags.append("Multiple capability gaps identified")
 
         # Profile completion warning
-        metadata = site_profile.get('metadata') or {}
-        profile_completion = metadata.get('profile_completion_percentage') or 0
+        profile_completion = site_view.profile_completion
         if profile_completion < 80:
             flags.append(f"Site profile only {profile_completion}% complete - improve for better autofill")
 
@@ -630,12 +593,23 @@ class AutofillEngine:
     ) -> Dict[str, Any]:
         """Intelligently autofill survey questions"""
 
-        # Load site profile
-        site = db.get(models.Site, site_id)
-        site_profile = self._build_site_profile(db, site)
+        # Load site profile: the site plus one IN query per child table
+        site = db.execute(
+            select(models.Site)
+            .where(models.Site.id == site_id)
+            .options(
+                selectinload(models.Site.equipment),
+                selectinload(models.Site.staff),
+                selectinload(models.Site.history),
+                selectinload(models.Site.patient_capabilities),
+                raiseload('*')
+            )
+        ).scalar_one()
+        site_profile = self._build_site_profile(site)
 
         # Process each question
         responses = []
+        rows = []
         autofilled_count = 0
         objective_count = 0
         subjective_count = 0
@@ -661,19 +635,21 @@ class AutofillEngine:
 
             responses.append(question)
 
-            # Save to database
-            db_response = models.SurveyResponse(
-                survey_id=survey_id,
-                question_id=question["id"],
-                question_text=question["text"],
-                question_type=question["type"],
-                is_objective=question["is_objective"],
-                response_value=str(question["response"]) if question["response"] else None,
-                response_source=question.get("source"),
-                confidence_score=question.get("confidence", 0)
-            )
-            db.add(db_response)
+            # Collect the row; all rows are inserted in one executemany below
+            rows.append({
+                "survey_id": survey_id,
+                "question_id": question["id"],
+                "question_text": question["text"],
+                "question_type": question["type"],
+                "is_objective": question["is_objective"],
+                "response_value": str(question["response"]) if question["response"] else None,
+                "response_source": question.get("source"),
+                "confidence_score": question.get("confidence", 0)
+            })
 
+        # Save to database
+        if rows:
+            db.execute(insert(models.SurveyResponse), rows)
         db.commit()
 
         completion_percentage = (autofilled_count / len(questions)) * 100 if questions else 0
@@ -689,8 +665,11 @@ class AutofillEngine:
             }
         }
 
-    def _build_site_profile(self, db: Session, site: models.Site) -> Dict:
-        """Build comprehensive site profile for matching"""
+    def _build_site_profile(self, site: models.Site) -> Dict:
+        """
+        Build comprehensive site profile for matching (child collections must be eager-loaded).
+        Text fields the matchers compare also get a pre-lowercased `*_lc` copy.
+        """
         profile = {
             "basic": {
                 "name": site.name,
@@ -704,32 +683,35 @@ class AutofillEngine:
         }
 
         # Load equipment
-        equipment = db.query(models.SiteEquipment).filter_by(site_id=site.id).all()
-        for eq in equipment:
+        for eq in site.equipment:
             profile["equipment"].append({
                 "type": eq.label,
                 "model": eq.model,
+                "type_lc": eq.label.lower(),
+                "model_lc": (eq.model or "").lower(),
+                "match_terms": tuple(t for t in (eq.label.lower(), (eq.model or "").lower()) if t),
                 "modality": eq.modality,
                 "count": eq.count,
                 "specs": eq.specs
             })
 
         # Load staff
-        staff = db.query(models.SiteStaff).filter_by(site_id=site.id).all()
-        for s in staff:
+        for s in site.staff:
             profile["staff"].append({
                 "role": s.role,
+                "role_lc": s.role.lower(),
                 "fte": s.fte,
                 "certifications": s.certifications,
                 "experience_years": s.experience_years
             })
 
         # Load experience
-        history = db.query(models.SiteHistory).filter_by(site_id=site.id).all()
-        for h in history:
+        for h in site.history:
             profile["experience"].append({
                 "indication": h.indication,
                 "phase": h.phase,
+                "indication_lc": (h.indication or "").lower(),
+                "phase_lc": (h.phase or "").lower(),
                 "enrollment_rate": h.enrollment_rate,
                 "startup_days": h.startup_days,
                 "completed": h.completed,
@@ -737,10 +719,10 @@ class AutofillEngine:
             })
 
         # Load capabilities
-        capabilities = db.query(models.SitePatientCapability).filter_by(site_id=site.id).all()
-        for c in capabilities:
+        for c in site.patient_capabilities:
             profile["capabilities"].append({
                 "indication": c.indication_label,
+                "indication_lc": (c.indication_label or "").lower(),
                 "age_min": c.age_min_years,
                 "age_max": c.age_max_years,
                 "sex": c.sex,
@@ -758,22 +740,23 @@ class AutofillEngine:
         """Attempt to autofill an objective question"""
 
         question_text = question["text"].lower()
+        category = _first_category(question_text, _OBJECTIVE_CATEGORIES)
         response = None
         source = None
         confidence = 0
 
         # Equipment-related questions
-        if any(word in question_text for word in ['equipment', 'device', 'machine']):
+        if category == 'equipment':
             response, confidence = self._match_equipment(question_text, site_profile["equipment"])
             source = "site_profile"
 
         # Staff-related questions
-        elif any(word in question_text for word in ['staff', 'personnel', 'coordinator', 'investigator']):
+        elif category == 'staff':
             response, confidence = self._match_staff(question_text, site_profile["staff"])
             source = "site_profile"
 
         # Experience-related questions
-        elif any(word in question_text for word in ['experience', 'previous', 'completed', 'enrolled']):
+        elif category == 'experience':
             response, confidence = self._match_experience(
                 question_text,
                 site_profile["experience"],
@@ -782,7 +765,7 @@ class AutofillEngine:
             source = "site_profile"
 
         # Patient population questions
-        elif any(word in question_text for word in ['patient', 'population', 'participants', 'subjects']):
+        elif category == 'population':
             response, confidence = self._match_population(
                 question_text,
                 site_profile["capabilities"],
@@ -791,13 +774,13 @@ class AutofillEngine:
             source = "site_profile"
 
         # EMR/Systems questions
-        elif any(word in question_text for word in ['emr', 'electronic', 'system', 'software']):
+        elif category == 'emr':
             response = site_profile["basic"]["emr"]
             confidence = 1.0
             source = "site_profile"
 
         # Protocol-specific questions
-        elif any(word in question_text for word in ['phase', 'indication', 'sponsor']):
+        elif category == 'protocol':
             response, confidence = self._extract_from_protocol(question_text, protocol_data)
             source = "protocol_extraction"
 
@@ -810,8 +793,7 @@ class AutofillEngine:
     def _match_equipment(self, question: str, equipment: List[Dict]) -> tuple:
         """Match equipment questions with site equipment"""
         for eq in equipment:
-            eq_terms = [eq["type"].lower(), eq.get("model", "").lower()]
-            if any(term in question for term in eq_terms if term):
+            if any(term in question for term in eq["match_terms"]):
                 # Format response based on question type
                 if 'how many' in question:
                     return (eq.get("count", 1), 0.9)  # Count of matching equipment
@@ -827,14 +809,22 @@ class AutofillEngine:
 
     def _match_staff(self, question: str, staff: List[Dict]) -> tuple:
         """Match staff questions with site personnel"""
-        total_fte = sum(s.get("fte", 0) for s in staff)
+        # One pass for all three aggregates
+        total_fte = 0
+        crc_count = 0
+        pi_count = 0
+        for s in staff:
+            total_fte += s.get("fte") or 0
+            role = s["role_lc"]
+            if 'coordinator' in role:
+                crc_count += 1
+            if 'investigator' in role or 'pi' in role:
+                pi_count += 1
 
         if 'how many' in question or 'number of' in question:
             if 'coordinator' in question:
-                crc_count = len([s for s in staff if 'coordinator' in s["role"].lower()])
                 return (crc_count, 0.9)
             elif 'investigator' in question:
-                pi_count = len([s for s in staff if 'investigator' in s["role"].lower() or 'pi' in s["role"].lower()])
                 return (pi_count, 0.9)
             else:
                 return (len(staff), 0.8)
@@ -855,8 +845,8 @@ class AutofillEngine:
         # Find relevant experience
         relevant_exp = [
             e for e in experience
-            if (protocol_indication and protocol_indication in e.get("indication", "").lower())
-            or (protocol_phase and protocol_phase in e.get("phase", "").lower())
+            if (protocol_indication and protocol_indication in e["indication_lc"])
+            or (protocol_phase and protocol_phase in e["phase_lc"])
         ]
 
         if not relevant_exp:
@@ -880,7 +870,7 @@ class AutofillEngine:
 
         relevant_cap = [
             c for c in capabilities
-            if protocol_indication in c.get("indication", "").lower()
+            if protocol_indication in c["indication_lc"]
         ]
 
         if not relevant_cap and capabilities:
@@ -923,17 +913,18 @@ class AutofillEngine:
         """Intelligently match site capabilities + protocol needs to answer survey questions"""
 
         question_text = question["text"].lower()
+        category = _first_category(question_text, _INTELLIGENT_CATEGORIES)
         response = None
         source = None
         confidence = 0
 
         # Population access questions
-        if "access" in question_text and "population" in question_text:
+        if category == 'population_access':
             annual_volume = site_capabilities.get("annual_volume", 0) or 0
             therapeutic_areas = site_capabilities.get("therapeutic_areas", []) or []
-            protocol_indication = protocol_requirements.get("study_identification", {}).get("indication", "") or ""
+            protocol_indication = (protocol_requirements.get("study_identification", {}).get("indication", "") or "").lower()
 
-            if annual_volume and annual_volume > 1000 and therapeutic_areas and any(area.lower() in protocol_indication.lower() for area in therapeutic_areas):
+            if annual_volume and annual_volume > 1000 and therapeutic_areas and any(area.lower() in protocol_indication for area in therapeutic_areas):
                 response = "Yes"
                 confidence = 0.9
             else:
@@ -942,7 +933,7 @@ class AutofillEngine:
             source = "site_profile"
 
         # Patient enrollment rate questions
-        elif "enroll per month" in question_text or "patients" in question_text and "month" in question_text:
+        elif category == 'enrollment_rate':
             annual_volume = site_capabilities.get("annual_volume", 0)
             # Estimate monthly enrollment as ~5% of annual volume for specialized studies
             monthly_estimate = max(1, int(annual_volume * 0.05 / 12))
@@ -951,13 +942,14 @@ class AutofillEngine:
             source = "site_profile"
 
         # Equipment questions
-        elif "equipment" in question_text or "special" in question_text:
-            site_equipment = site_capabilities.get("equipment", [])
+        elif category == 'equipment':
+            site_equipment = [eq.lower() for eq in site_capabilities.get("equipment", [])]
             protocol_equipment = protocol_requirements.get("equipment_needed", [])
 
             missing_equipment = []
             for req_equipment in protocol_equipment:
-                if not any(req_equipment.lower() in eq.lower() for eq in site_equipment):
+                req_lower = req_equipment.lower()
+                if not any(req_lower in eq for eq in site_equipment):
                     missing_equipment.append(req_equipment)
 
             if missing_equipment:
@@ -969,7 +961,7 @@ class AutofillEngine:
             source = "site_profile"
 
         # Staff adequacy questions
-        elif "adequate staff" in question_text or "staff" in question_text:
+        elif category == 'staff':
             staff_fte = site_capabilities.get("staff_fte", 0)
             protocol_staff_req = protocol_requirements.get("staff_requirements", {})
             required_hours = protocol_staff_req.get("coordinator_time_hours_week", 10)
@@ -983,11 +975,11 @@ class AutofillEngine:
             source = "site_profile"
 
         # Sponsor/CRO experience questions
-        elif "experience" in question_text and ("sponsor" in question_text or "cro" in question_text):
+        elif category == 'sponsor_experience':
             previous_sponsors = site_capabilities.get("experience", [])
-            protocol_sponsor = protocol_requirements.get("study_identification", {}).get("sponsor", "")
+            protocol_sponsor = (protocol_requirements.get("study_identification", {}).get("sponsor", "") or "").lower()
 
-            if any(sponsor.lower() in protocol_sponsor.lower() for sponsor in previous_sponsors):
+            if any(sponsor.lower() in protocol_sponsor for sponsor in previous_sponsors):
                 response = "Yes"
                 confidence = 0.9
             else:
@@ -996,7 +988,7 @@ class AutofillEngine:
             source = "site_profile"
 
         # Budget questions (marked as subjective in our model, but could provide guidance)
-        elif "budget" in question_text:
+        elif category == 'budget':
             # This is typically subjective, but we can provide a preliminary assessment
             response = "Requires detailed review"
             confidence = 0.3
@@ -1018,30 +1010,32 @@ class AutofillEngine:
         """Calculate overall feasibility score based on autofilled responses"""
 
         total_score = 0
-        weight_sum = 0
+        scored = 0
 
         for response in responses:
-            if response.get("is_objective") and response.get("response"):
-                weight = 1.0
-                score = 0
-
-                if response["response"] in ["Yes", "All required equipment available"]:
-                    score = 100
-                elif "available" in str(response["response"]).lower():
-                    score = 90
-                elif response["response"] in ["No", "Missing:"]:
-                    score = 30
-                elif "limited" in str(response["response"]).lower():
-                    score = 60
-                elif "may need" in str(response["response"]).lower():
-                    score = 70
-                else:
-                    score = 80  # Neutral/informational responses
+            value = response.get("response")
+            if not (value and response.get("is_objective")):
+                continue
 
-                total_score += score * weight
-                weight_sum += weight
+            # Stringify/lowercase once per response (every response has weight 1)
+            value_lower = str(value).lower()
+            if value in ("Yes", "All required equipment available"):
+                score = 100
+            elif "available" in value_lower:
+                score = 90
+            elif value in ("No", "Missing:"):
+                score = 30
+            elif "limited" in value_lower:
+                score = 60
+            elif "may need" in value_lower:
+                score = 70
+            else:
+                score = 80  # Neutral/informational responses
 
-        return int(total_score / weight_sum) if weight_sum > 0 else 85
+            total_score += score
+            scored += 1
+
+        return int(total_score / scored) if scored > 0 else 85
 
     def _generate_flags(
         self,
@@ -1053,23 +1047,26 @@ class AutofillEngine:
 
         flags = []
 
-        # Check for equipment gaps
-        for response in responses:
-            if response.get("response") and "Missing:" in str(response["response"]):
-                flags.append("Equipment gaps identified")
-                break
-
-        # Check for staff concerns
+        # One pass for the three response-text concerns; stop once all are found
+        equipment_gap = staffing_concern = limited_access = False
         for response in responses:
-            if response.get("response") and "may need additional" in str(response["response"]).lower():
-                flags.append("Staffing concerns")
+            value = response.get("response")
+            if not value:
+                continue
+            text = str(value)
+            text_lower = text.lower()
+            equipment_gap = equipment_gap or "Missing:" in text
+            staffing_concern = staffing_concern or "may need additional" in text_lower
+            limited_access = limited_access or "limited access" in text_lower
+            if equipment_gap and staffing_concern and limited_access:
                 break
 
-        # Check for population access issues
-        for response in responses:
-            if response.get("response") and "limited access" in str(response["response"]).lower():
-                flags.append("Limited patient population access")
-                break
+        if equipment_gap:
+            flags.append("Equipment gaps identified")
+        if staffing_concern:
+            flags.append("Staffing concerns")
+        if limited_access:
+            flags.append("Limited patient population access")
 
         # Check target enrollment vs capacity
         target_enrollment = protocol_requirements.get("study_identification", {}).get("target_enrollment", 0) or 0
@@ -3,18 +3,61 @@ Comprehensive Feasibility Scorer with Disqualifier Logic
 Implements SME-guided scoring with critical disqualifier checks
 """
 
-from typing import Dict, List, Any, Tuple
+import re
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class FeasibilityResult:
     score: int
     confidence: float
     category_scores: Dict[str, float]
     disqualifier: str = None
     recommendation: str = ""
-    critical_gaps: List[str] = None
-    flags: List[str] = None
+    critical_gaps: Tuple[str, ...] = ()
+    flags: Tuple[str, ...] = ()
+
+# Critical gap reported when a category scores below 50
+CATEGORY_GAPS = {
+    "population_access": "Limited patient population access",
+    "equipment_match": "Equipment capabilities may be insufficient",
+    "staff_capacity": "Staff capacity concerns",
+    "historical_performance": "Limited historical performance data",
+}
+
+# Scoring is a pure function of (site_profile, protocol_requirements), so results are
+# memoized in a small LRU keyed by a hash of both inputs. Shared by all scorer
+# instances; callers may run on executor threads, hence the lock.
+SCORE_CACHE_SIZE = 512
+_score_cache: "OrderedDict[Tuple[str, str], FeasibilityResult]" = OrderedDict()
+_score_cache_lock = threading.Lock()
+
+# Free-text history metrics like "85%", "<2%", ">10%", "3 days", with an
+# optional comparison prefix
+_PCT_RE = re.compile(r'([<>]=?)?\s*(\d+(?:\.\d+)?)\s*%')
+_DAYS_RE = re.compile(r'([<>]=?)?\s*(\d+(?:\.\d+)?)\s*day')
+
+def _parse_number(value: Any, pattern: "re.Pattern", lower_is_better: bool = False) -> Optional[float]:
+    """
+    Number from a history metric, or None if absent. A bound on the wrong side
+    for the metric (">5%" deviations, "<70%" enrollment) only says the true
+    value is worse than the number, so it fails every bracket and returns None.
+    """
+    match = pattern.search(str(value)) if value else None
+    if not match:
+        return None
+    bad_prefix = '>' if lower_is_better else '<'
+    if match.group(1) and match.group(1).startswith(bad_prefix):
+        return None
+    return float(match.group(2))
+
+def _input_key(data: Any) -> str:
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
 
 class ComprehensiveFeasibilityScorer:
     """
@@ -29,12 +72,34 @@ class ComprehensiveFeasibilityScorer:
             "historical_performance": 15,
             "operational_readiness": 10
         }
+        # Weights as fractions of the total, for the weighted sum
+        self._weight_fractions = {category: weight / 100 for category, weight in self.category_weights.items()}
+
+    @staticmethod
+    def cache_clear() -> None:
+        """Drop all memoized scores"""
+        with _score_cache_lock:
+            _score_cache.clear()
 
     def calculate_feasibility_score(self, site_profile: Dict, protocol_requirements: Dict = None) -> FeasibilityResult:
         """
-        Calculate comprehensive feasibility score with disqualifier checks
+        Calculate comprehensive feasibility score with disqualifier checks (memoized per input pair)
         """
-
+        key = (_input_key(site_profile), _input_key(protocol_requirements))
+        with _score_cache_lock:
+            cached = _score_cache.get(key)
+            if cached is not None:
+                _score_cache.move_to_end(key)
+                return cached
+
+        result = self._score(site_profile, protocol_requirements)
+        with _score_cache_lock:
+            _score_cache[key] = result
+            if len(_score_cache) > SCORE_CACHE_SIZE:
+                _score_cache.popitem(last=False)
+        return result
+
+    def _score(self, site_profile: Dict, protocol_requirements: Dict = None) -> FeasibilityResult:
         # STEP 1: Critical Disqualifier Checks
         disqualifier = self._check_disqualifiers(site_profile, protocol_requirements)
         if disqualifier:
@@ -44,8 +109,8 @@ class ComprehensiveFeasibilityScorer:
                 category_scores={},
                 disqualifier=disqualifier,
                 recommendation="Not Recommended - Critical disqualifier",
-                critical_gaps=[disqualifier],
-                flags=[f"Disqualified: {disqualifier}"]
+                critical_gaps=(disqualifier,),
+                flags=(f"Disqualified: {disqualifier}",)
             )
 
         # STEP 2: Calculate category scores
@@ -59,7 +124,7 @@ class ComprehensiveFeasibilityScorer:
 
         # STEP 3: Calculate weighted total score
         total_score = sum(
-            category_scores[category] * (self.category_weights[category] / 100)
+            category_scores[category] * self._weight_fractions[category]
             for category in category_scores
         )
 
@@ -67,8 +132,7 @@ class ComprehensiveFeasibilityScorer:
         confidence = self._calculate_confidence(site_profile)
 
         # STEP 5: Identify critical gaps and flags
-        critical_gaps = self._identify_critical_gaps(site_profile, category_scores)
-        flags = self._generate_flags(site_profile, category_scores)
+        critical_gaps, flags = self._analyze_categories(site_profile, category_scores)
 
         # STEP 6: Generate recommendation
         recommendation = self._get_recommendation(int(total_score))
@@ -78,8 +142,8 @@ class ComprehensiveFeasibilityScorer:
             confidence=confidence,
             category_scores=category_scores,
             recommendation=recommendation,
-            critical_gaps=critical_gaps,
-            flags=flags
+            critical_gaps=tuple(critical_gaps),
+            flags=tuple(flags)
         )
 
     def _check_disqualifiers(self, site_profile: Dict, protocol_requirements: Dict = None) -> str:
@@ -240,7 +304,7 @@ class ComprehensiveFeasibilityScorer:
             score += 10
 
         # Coverage
-        if investigators.get('coverage', '').find('24/7') != -1:
+        if '24/7' in investigators.get('coverage', ''):
             score += 15
 
         return min(score, 100)
@@ -265,36 +329,40 @@ class ComprehensiveFeasibilityScorer:
             score += 10
 
         # Enrollment success rate
-        enrollment_success = history.get('enrollment_success_rate', '')
-        if '85%' in enrollment_success or '90%' in enrollment_success or '95%' in enrollment_success:
-            score += 25
-        elif '75%' in enrollment_success or '80%' in enrollment_success:
-            score += 20
-        elif '70%' in enrollment_success:
-            score += 15
+        enrollment_pct = _parse_number(history.get('enrollment_success_rate', ''), _PCT_RE)
+        if enrollment_pct is not None:
+            if enrollment_pct >= 85:
+                score += 25
+            elif enrollment_pct >= 75:
+                score += 20
+            elif enrollment_pct >= 70:
+                score += 15
 
         # Retention rate
-        retention_rate = history.get('retention_rate', '')
-        if '95%' in retention_rate or '90%' in retention_rate:
-            score += 20
-        elif '85%' in retention_rate:
-            score += 15
-        elif '80%' in retention_rate:
-            score += 10
+        retention_pct = _parse_number(history.get('retention_rate', ''), _PCT_RE)
+        if retention_pct is not None:
+            if retention_pct >= 90:
+                score += 20
+            elif retention_pct >= 85:
+                score += 15
+            elif retention_pct >= 80:
+                score += 10
 
-        # Protocol deviation rate
-        deviation_rate = history.get('protocol_deviation_rate', '')
-        if '<2%' in deviation_rate or '<3%' in deviation_rate:
-            score += 15
-        elif '<5%' in deviation_rate:
-            score += 10
+        # Protocol deviation rate (lower is better)
+        deviation_pct = _parse_number(history.get('protocol_deviation_rate', ''), _PCT_RE, lower_is_better=True)
+        if deviation_pct is not None:
+            if deviation_pct <= 3:
+                score += 15
+            elif deviation_pct <= 5:
+                score += 10
 
-        # Query resolution time
-        query_time = history.get('average_query_resolution_time', '')
-        if '3 days' in query_time or '2 days' in query_time or '1 day' in query_time:
-            score += 15
-        elif '5 days' in query_time or '4 days' in query_time:
-            score += 10
+        # Query resolution time (lower is better)
+        query_days = _parse_number(history.get('average_query_resolution_time', ''), _DAYS_RE, lower_is_better=True)
+        if query_days is not None:
+            if query_days <= 3:
+                score += 15
+            elif query_days <= 5:
+                score += 10
 
         return min(score, 100)
 
@@ -361,30 +429,11 @@ class ComprehensiveFeasibilityScorer:
 
         return completed_sections / total_sections
 
-    def _identify_critical_gaps(self, site_profile: Dict, category_scores: Dict) -> List[str]:
+    def _analyze_categories(self, site_profile: Dict, category_scores: Dict) -> Tuple[List[str], List[str]]:
         """
-        Identify critical gaps that need attention
+        Identify critical gaps and generate warning flags in one pass over the category scores
         """
         gaps = []
-
-        if category_scores.get('population_access', 0) < 50:
-            gaps.append("Limited patient population access")
-
-        if category_scores.get('equipment_match', 0) < 50:
-            gaps.append("Equipment capabilities may be insufficient")
-
-        if category_scores.get('staff_capacity', 0) < 50:
-            gaps.append("Staff capacity concerns")
-
-        if category_scores.get('historical_performance', 0) < 50:
-            gaps.append("Limited historical performance data")
-
-        return gaps
-
-    def _generate_flags(self, site_profile: Dict, category_scores: Dict) -> List[str]:
-        """
-        Generate warning flags for potential issues
-        """
         flags = []
 
         # Check current study load
@@ -395,12 +444,14 @@ class ComprehensiveFeasibilityScorer:
         elif current_studies >= 6:
             flags.append("Moderate current study load")
 
-        # Check for low scores
+        # Critical gaps below 50, low-score flags below 60
         for category, score in category_scores.items():
+            if score < 50 and category in CATEGORY_GAPS:
+                gaps.append(CATEGORY_GAPS[category])
             if score < 60:
                 flags.append(f"Low {category.replace('_', ' ')} score")
 
-        return flags
+        return gaps, flags
 
     def _get_recommendation(self, score: int) -> str:
         """
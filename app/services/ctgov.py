@@ -1,32 +1,76 @@
 # app/ctgov.py
 from __future__ import annotations
 import re
-from typing import Any, Dict, List, Optional
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 API_BASE = "https://clinicaltrials.gov/api/v2"
 
+# Shared session so back-to-back NCT lookups reuse pooled TLS connections
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+))
+
+# Recently fetched studies keyed by upper-cased NCT id, stored with their
+# validators so repeat lookups revalidate with a conditional request
+STUDY_CACHE_SIZE = 256
+_study_cache: "OrderedDict[str, Tuple[Optional[str], Optional[str], Dict[str, Any]]]" = OrderedDict()
+_study_cache_lock = threading.Lock()  # the import route runs in FastAPI's threadpool
+
+def _store_study(nct_id: str, entry: Tuple[Optional[str], Optional[str], Dict[str, Any]]) -> None:
+    with _study_cache_lock:
+        _study_cache[nct_id] = entry
+        _study_cache.move_to_end(nct_id)
+        if len(_study_cache) > STUDY_CACHE_SIZE:
+            _study_cache.popitem(last=False)
+
+_NCT_ID_RE = re.compile(r"NCT\d{8}")
+
 def fetch_study(nct_id: str) -> Dict[str, Any]:
     nct_id = nct_id.strip().upper()
-    r = requests.get(f"{API_BASE}/studies/{nct_id}", timeout=15)
+    # Reject malformed ids locally instead of paying a round-trip for a 404
+    if not _NCT_ID_RE.fullmatch(nct_id):
+        raise ValueError(f"Invalid NCT id: {nct_id}")
+    with _study_cache_lock:
+        cached = _study_cache.get(nct_id)
+    headers: Dict[str, str] = {}
+    if cached is not None:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    r = _SESSION.get(f"{API_BASE}/studies/{nct_id}", headers=headers, timeout=15)
+    if r.status_code == 304 and cached is not None:
+        # Re-store rather than move_to_end: another thread may have evicted it
+        _store_study(nct_id, cached)
+        return cached[2]
     if r.status_code != 200:
         raise RuntimeError(f"CT.gov fetch failed: {r.status_code}")
-    return r.json()
+    data = r.json()
+    etag = r.headers.get("ETag")
+    last_modified = r.headers.get("Last-Modified")
+    if etag or last_modified:
+        _store_study(nct_id, (etag, last_modified, data))
+    return data
 
 # --- helpers to normalize ages ---
-_AGE_RE = re.compile(r"(?i)\b(\d+)\s*(year|yr|years|yrs|y)\b")
+# ISO 8601 duration like 'P18Y' (only at the start), else '18 Years' etc. anywhere
+_AGE_RE = re.compile(r"(?i)^P(\d+)Y|\b(\d+)\s*(?:year|yr|years|yrs|y)\b")
 def _age_to_years(age: Optional[str]) -> Optional[int]:
     if not age:
         return None
     s = age.strip()
-    # Try ISO 8601 duration like 'P18Y'
-    m = re.match(r"(?i)P(\d+)Y", s)
-    if m:
-        return int(m.group(1))
-    # Try '18 Years' etc.
     m = _AGE_RE.search(s)
     if m:
-        return int(m.group(1))
+        return int(m.group(1) or m.group(2))
     # Try plain number
     try:
         return int(float(s))
@@ -39,16 +83,17 @@ def build_requirements_from_ctgov(study_json: Dict[str, Any]) -> Dict[str, Any]:
     Keeps this minimal and deterministic for your rules engine.
     """
     study = study_json.get("studies", [{}])[0] if "studies" in study_json else study_json
-    id_info = study.get("protocolSection", {}).get("identificationModule", {})
+    protocol = study.get("protocolSection") or {}
+    id_info = protocol.get("identificationModule") or {}
     nct_id = id_info.get("nctId")
     brief_title = id_info.get("briefTitle")
 
-    elig = study.get("protocolSection", {}).get("eligibilityModule", {}) or {}
+    elig = protocol.get("eligibilityModule") or {}
     min_age = _age_to_years(elig.get("minimumAge"))
     max_age = _age_to_years(elig.get("maximumAge"))
     sex = (elig.get("sex", "") or "").lower()  # "all" | "male" | "female"
 
-    design = study.get("protocolSection", {}).get("designModule", {}) or {}
+    design = protocol.get("designModule") or {}
     phase = (design.get("phases") or [])
     # phases is array like ["PHASE2"], normalize simple string
     phase_simple = phase[0] if phase else None
@@ -1,88 +1,206 @@
-import json
-import PyPDF2
-import io
+import orjson
+import os
+import threading
+import time
+import hashlib
+import pypdfium2 as pdfium
 import re
-from typing import Dict, List, Any, Optional
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+from app.services import llm_provider
 from app.services.llm_provider import generate
 
+# Bump when the extraction prompt changes so stale cached responses are not reused
+PROMPT_VERSION = "2"
+
+# In-process cache of raw LLM extraction responses keyed by PDF content, prompt
+# version and model, so re-uploading the same protocol skips the LLM round-trip
+EXTRACTION_CACHE_SIZE = 64
+EXTRACTION_CACHE_TTL = 7 * 86400  # seconds
+_extraction_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_extraction_cache_lock = threading.Lock()  # extraction runs in executor threads
+
+# PDFium is not thread-safe, even across separate documents; every pdfium call
+# runs under this lock (never held across a generator yield)
+_pdfium_lock = threading.Lock()
+
+# Static extraction instructions and schema. Kept in the system message, ahead
+# of the document text, so the prompt prefix is byte-identical across calls and
+# eligible for the provider's automatic prompt caching
+EXTRACTION_SYSTEM_PROMPT = """You are a clinical research expert extracting protocol information for feasibility assessment.
+Be precise and only extract explicitly stated information. Return valid JSON.
+
+Extract protocol information from the clinical trial document in the user message.
+
+REQUIRED FIELDS:
+{
+    "protocol_title": "exact title",
+    "protocol_number": "NCT ID or protocol number",
+    "phase": "Phase I/II/III/IV/Device/Other",
+    "sponsor": "sponsor/CRO name",
+    "indication": "disease/condition being studied",
+    "drug_administration": "PO/IV/SQ/IM/NA",
+    "population_age": "age range from inclusion criteria",
+    "expected_enrollment": "target enrollment number",
+    "inclusion_criteria": ["list", "of", "key", "inclusion", "criteria"],
+    "exclusion_criteria": ["list", "of", "key", "exclusion", "criteria"],
+    "procedures": ["list", "of", "study", "procedures"],
+    "equipment_required": ["required", "equipment", "list"],
+    "pk_samples": "yes/no - PK sample collection",
+    "pk_intensive": "yes/no - intensive PK sampling",
+    "washout_period": "yes/no - washout required",
+    "visit_frequency": "visit schedule description",
+    "study_duration": "total study duration"
+}
+
+Return only valid JSON. Use "unclear" for uncertain extractions."""
+
+# Leading characters of the protocol sent to the LLM for key info
+TEXT_SAMPLE_CHARS = 8000
+
+# Fields whose extraction success determines the confidence level
+CONFIDENCE_FIELDS = ("protocol_title", "phase", "indication", "expected_enrollment")
+
+# Fallback extraction patterns, compiled once and matched case-insensitively
+# so the PDF text never needs a lower-cased copy
+_NCT_RE = re.compile(r'NCT\d{8}', re.IGNORECASE)
+_PHASE_RE = re.compile(r'\bphase\s+(iv|iii|ii|i)\b', re.IGNORECASE)
+_PHASE_LABELS = {"i": "Phase I", "ii": "Phase II", "iii": "Phase III", "iv": "Phase IV"}
+
+def _extraction_cache_key(pdf_bytes: bytes) -> str:
+    digest = hashlib.sha256(len(pdf_bytes).to_bytes(8, "big"))
+    digest.update(pdf_bytes)
+    digest.update(PROMPT_VERSION.encode())
+    digest.update(llm_provider.PROVIDER.encode())
+    digest.update(os.getenv("LLM_MODEL", "gpt-5-mini").encode())
+    return digest.hexdigest()
+
+def _cached_extraction(key: str) -> Optional[Dict[str, Any]]:
+    with _extraction_cache_lock:
+        entry = _extraction_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at < time.monotonic():
+            del _extraction_cache[key]
+            return None
+        _extraction_cache.move_to_end(key)
+    try:
+        extracted = orjson.loads(response)
+    except orjson.JSONDecodeError:
+        extracted = None
+    if not isinstance(extracted, dict):
+        with _extraction_cache_lock:
+            _extraction_cache.pop(key, None)
+        return None
+    return extracted
+
+def _is_json_object(response: str) -> bool:
+    """Whether an LLM reply is a JSON object the extraction can use"""
+    try:
+        return isinstance(orjson.loads(response), dict)
+    except orjson.JSONDecodeError:
+        return False
+
+def _store_extraction(key: str, response: str) -> None:
+    with _extraction_cache_lock:
+        _extraction_cache[key] = (time.monotonic() + EXTRACTION_CACHE_TTL, response)
+        _extraction_cache.move_to_end(key)
+        if len(_extraction_cache) > EXTRACTION_CACHE_SIZE:
+            _extraction_cache.popitem(last=False)
+
 class ProtocolDocumentProcessor:
     """Extract structured data from sponsor protocol PDFs"""
 
-    def extract_text_from_pdf(self, pdf_bytes: bytes) -> str:
-        """Extract text from PDF with structure preservation"""
+    def iter_page_texts(self, pdf_bytes: bytes) -> Iterator[str]:
+        """Yield each page's text with its page marker, parsing pages lazily"""
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
-            text_parts = []
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                text_parts.append(f"\n--- PAGE {page_num + 1} ---\n{page_text}")
-            return "\n".join(text_parts)
+            with _pdfium_lock:
+                pdf = pdfium.PdfDocument(pdf_bytes)
+                page_count = len(pdf)
         except Exception as e:
             raise ValueError(f"Failed to extract PDF text: {e}")
+        try:
+            for page_num in range(page_count):
+                try:
+                    with _pdfium_lock:
+                        page = pdf[page_num]
+                        textpage = page.get_textpage()
+                        try:
+                            page_text = textpage.get_text_range()
+                        finally:
+                            textpage.close()
+                            page.close()
+                except Exception as e:
+                    raise ValueError(f"Failed to extract PDF text: {e}")
+                yield f"\n--- PAGE {page_num + 1} ---\n{page_text}"
+        finally:
+            with _pdfium_lock:
+                pdf.close()
+
+    def extract_text_from_pdf(self, pdf_bytes: bytes) -> str:
+        """Extract text from PDF with structure preservation"""
+        return "\n".join(self.iter_page_texts(pdf_bytes))
 
     def extract_protocol_data(self, pdf_bytes: bytes) -> Dict[str, Any]:
         """Extract structured protocol data for feasibility assessment"""
 
-        full_text = self.extract_text_from_pdf(pdf_bytes)
-        text_sample = full_text[:8000]  # First 8000 chars for key info
-
-        system_prompt = """You are a clinical research expert extracting protocol information for feasibility assessment.
-        Be precise and only extract explicitly stated information. Return valid JSON."""
-
-        user_prompt = f"""
-        Extract protocol information from this clinical trial document:
-
-        REQUIRED FIELDS:
-        {{
-            "protocol_title": "exact title",
-            "protocol_number": "NCT ID or protocol number",
-            "phase": "Phase I/II/III/IV/Device/Other",
-            "sponsor": "sponsor/CRO name",
-            "indication": "disease/condition being studied",
-            "drug_administration": "PO/IV/SQ/IM/NA",
-            "population_age": "age range from inclusion criteria",
-            "expected_enrollment": "target enrollment number",
-            "inclusion_criteria": ["list", "of", "key", "inclusion", "criteria"],
-            "exclusion_criteria": ["list", "of", "key", "exclusion", "criteria"],
-            "procedures": ["list", "of", "study", "procedures"],
-            "equipment_required": ["required", "equipment", "list"],
-            "pk_samples": "yes/no - PK sample collection",
-            "pk_intensive": "yes/no - intensive PK sampling",
-            "washout_period": "yes/no - washout required",
-            "visit_frequency": "visit schedule description",
-            "study_duration": "total study duration"
-        }}
-
-        DOCUMENT TEXT:
-        {text_sample}
-
-        Return only valid JSON. Use "unclear" for uncertain extractions.
-        """
+        cache_key = _extraction_cache_key(pdf_bytes)
+        extracted = _cached_extraction(cache_key)
+        if extracted is not None:
+            extracted["extraction_confidence"] = self._calculate_confidence(extracted)
+            return extracted
+
+        # Only parse pages until the prompt sample is full; the rest of the
+        # document is read only if the regex fallback needs it
+        pages = self.iter_page_texts(pdf_bytes)
+        text_parts = []
+        text_length = -1
+        for page_text in pages:
+            text_parts.append(page_text)
+            text_length += len(page_text) + 1
+            if text_length >= TEXT_SAMPLE_CHARS:
+                break
+        text_sample = "\n".join(text_parts)[:TEXT_SAMPLE_CHARS]
 
         try:
             messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
+                {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
+                {"role": "user", "content": f"DOCUMENT TEXT:\n{text_sample}"}
             ]
 
-            response = generate(messages, temperature=0.1, max_tokens=2000)
-            extracted = json.loads(response)
+            response = generate(messages, temperature=0.1, max_tokens=2000, accept=_is_json_object)
+            extracted = orjson.loads(response)
+            if not isinstance(extracted, dict):
+                # Valid JSON but not an object: use the regex fallback, and never cache it
+                raise orjson.JSONDecodeError("Expected a JSON object", response, 0)
+            _store_extraction(cache_key, response)
 
             # Add confidence scoring
             extracted["extraction_confidence"] = self._calculate_confidence(extracted)
             return extracted
 
-        except json.JSONDecodeError:
-            return self._fallback_extraction(full_text)
+        except orjson.JSONDecodeError:
+            text_parts.extend(pages)
+            return self._fallback_extraction("\n".join(text_parts))
         except Exception as e:
             return {"error": f"Extraction failed: {e}"}
+        finally:
+            pages.close()
 
     def _calculate_confidence(self, data: Dict[str, Any]) -> str:
         """Calculate extraction confidence level"""
-        required_fields = ["protocol_title", "phase", "indication", "expected_enrollment"]
-        successful_extractions = sum(1 for field in required_fields if data.get(field) and data[field] != "unclear")
-
-        confidence_ratio = successful_extractions / len(required_fields)
+        total = len(CONFIDENCE_FIELDS)
+        successful_extractions = total
+        for field in CONFIDENCE_FIELDS:
+            value = data.get(field)
+            if not value or value == "unclear":
+                successful_extractions -= 1
+                # Stop once even the remaining fields cannot lift it above "low"
+                if successful_extractions / total <= 0.5:
+                    return "low"
+
+        confidence_ratio = successful_extractions / total
         if confidence_ratio > 0.8:
             return "high"
         elif confidence_ratio > 0.5:
@@ -95,17 +213,12 @@ class ProtocolDocumentProcessor:
         data = {"extraction_confidence": "low"}
 
         # Basic pattern matching
-        nct_match = re.search(r'NCT\d{8}', text, re.IGNORECASE)
+        nct_match = _NCT_RE.search(text)
         if nct_match:
             data["protocol_number"] = nct_match.group()
 
-        if "phase i" in text.lower():
-            data["phase"] = "Phase I"
-        elif "phase ii" in text.lower():
-            data["phase"] = "Phase II"
-        elif "phase iii" in text.lower():
-            data["phase"] = "Phase III"
-        elif "phase iv" in text.lower():
-            data["phase"] = "Phase IV"
+        phase_match = _PHASE_RE.search(text)
+        if phase_match:
+            data["phase"] = _PHASE_LABELS[phase_match.group(1).lower()]
 
         return data
\ No newline at end of file
@@ -1,26 +1,49 @@
 from typing import Dict, List
 import json
 from datetime import datetime
-import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
+from email.message import EmailMessage
 import io
 
+_HEADER_FONT = Font(bold=True)
+
+def _cell_value(value):
+    """Excel cells take scalars only; lists/dicts from AI answers become text"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
 class ExportService:
+    # Built once and shared across exports; ExportService is created per request
+    _STYLES = getSampleStyleSheet()
+    _METADATA_TABLE_STYLE = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ])
+    _OBJECTIVE_TABLE_STYLE = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ])
+
     def generate_pdf_export(self, survey_data: Dict, responses: List[Dict]) -> bytes:
         """Generate PDF export of completed survey"""
         buffer = io.BytesIO()
 
         # Create PDF
         doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
+        styles = self._STYLES
         story = []
 
         # Title
@@ -40,13 +63,7 @@ class ExportService:
         ]
 
         metadata_table = Table(metadata, colWidths=[120, 380])
-        metadata_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ]))
+        metadata_table.setStyle(self._METADATA_TABLE_STYLE)
         story.append(metadata_table)
         story.append(Spacer(1, 20))
 
@@ -55,27 +72,26 @@ class ExportService:
         story.append(Spacer(1, 12))
 
         # Separate objective and subjective
-        objective_responses = [r for r in responses if r.get('is_objective')]
-        subjective_responses = [r for r in responses if not r.get('is_objective')]
+        objective_responses = []
+        subjective_responses = []
+        for r in responses:
+            (objective_responses if r.get('is_objective') else subjective_responses).append(r)
 
         # Objective Section
         if objective_responses:
             story.append(Paragraph("<b>Objective Responses (Auto-filled)</b>", styles['Heading2']))
             obj_data = []
             for resp in objective_responses:
+                text = resp['text']
+                confidence = resp.get('confidence')
                 obj_data.append([
-                    resp['text'][:80] + "..." if len(resp['text']) > 80 else resp['text'],
+                    text[:80] + "..." if len(text) > 80 else text,
                     str(resp.get('response', 'N/A')),
-                    f"{resp.get('confidence', 0):.0f}%" if resp.get('confidence') else "Manual"
+                    f"{confidence:.0f}%" if confidence else "Manual"
                 ])
 
             obj_table = Table(obj_data, colWidths=[280, 150, 70])
-            obj_table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 9),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ]))
+            obj_table.setStyle(self._OBJECTIVE_TABLE_STYLE)
             story.append(obj_table)
             story.append(Spacer(1, 20))
 
@@ -98,59 +114,67 @@ class ExportService:
         """Generate Excel export of completed survey"""
         buffer = io.BytesIO()
 
-        # Create Excel writer
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            # Summary sheet
-            summary_data = {
-                'Field': ['Sponsor', 'Study', 'NCT Number', 'Site', 'Feasibility Score', 'Completion %', 'Export Date'],
-                'Value': [
-                    survey_data['sponsor_name'],
-                    survey_data['study_name'],
-                    survey_data.get('nct_number', 'N/A'),
-                    survey_data['site_name'],
-                    survey_data.get('feasibility_score', 'N/A'),
-                    f"{survey_data.get('completion_percentage', 0):.1f}%",
-                    datetime.now().strftime("%Y-%m-%d")
-                ]
-            }
-            summary_df = pd.DataFrame(summary_data)
-            summary_df.to_excel(writer, sheet_name='Summary', index=False)
-
-            # Responses sheet
-            responses_data = []
-            for resp in responses:
-                responses_data.append({
-                    'Question ID': resp['id'],
-                    'Question': resp['text'],
-                    'Type': resp['type'],
-                    'Objective/Subjective': 'Objective' if resp.get('is_objective') else 'Subjective',
-                    'Response': resp.get('response', ''),
-                    'Source': resp.get('source', 'Manual'),
-                    'Confidence': f"{resp.get('confidence', 0):.0f}%" if resp.get('confidence') else 'N/A'
-                })
-
-            responses_df = pd.DataFrame(responses_data)
-            responses_df.to_excel(writer, sheet_name='Responses', index=False)
-
-            # Scoring breakdown sheet
-            if survey_data.get('score_breakdown'):
-                breakdown_data = []
-                for category, details in survey_data['score_breakdown'].items():
-                    breakdown_data.append({
-                        'Category': category,
-                        'Score': details.get('score', 0),
-                        'Weight': details.get('weight', 0),
-                        'Weighted Score': details.get('weighted_score', 0)
-                    })
-
-                breakdown_df = pd.DataFrame(breakdown_data)
-                breakdown_df.to_excel(writer, sheet_name='Score Breakdown', index=False)
-
+        # Write-only workbook streams rows out instead of keeping a cell grid
+        workbook = Workbook(write_only=True)
+
+        # Summary sheet
+        summary_sheet = workbook.create_sheet('Summary')
+        summary_sheet.append(self._header_row(summary_sheet, ('Field', 'Value')))
+        summary_sheet.append(('Sponsor', survey_data['sponsor_name']))
+        summary_sheet.append(('Study', survey_data['study_name']))
+        summary_sheet.append(('NCT Number', survey_data.get('nct_number', 'N/A')))
+        summary_sheet.append(('Site', survey_data['site_name']))
+        summary_sheet.append(('Feasibility Score', _cell_value(survey_data.get('feasibility_score', 'N/A'))))
+        summary_sheet.append(('Completion %', f"{survey_data.get('completion_percentage', 0):.1f}%"))
+        summary_sheet.append(('Export Date', datetime.now().strftime("%Y-%m-%d")))
+
+        # Responses sheet
+        responses_sheet = workbook.create_sheet('Responses')
+        responses_sheet.append(self._header_row(responses_sheet, (
+            'Question ID', 'Question', 'Type', 'Objective/Subjective', 'Response', 'Source', 'Confidence'
+        )))
+        for resp in responses:
+            confidence = resp.get('confidence')
+            responses_sheet.append((
+                resp['id'],
+                resp['text'],
+                resp['type'],
+                'Objective' if resp.get('is_objective') else 'Subjective',
+                _cell_value(resp.get('response', '')),
+                resp.get('source', 'Manual'),
+                f"{confidence:.0f}%" if confidence else 'N/A'
+            ))
+
+        # Scoring breakdown sheet
+        if survey_data.get('score_breakdown'):
+            breakdown_sheet = workbook.create_sheet('Score Breakdown')
+            breakdown_sheet.append(self._header_row(
+                breakdown_sheet, ('Category', 'Score', 'Weight', 'Weighted Score')
+            ))
+            for category, details in survey_data['score_breakdown'].items():
+                breakdown_sheet.append((
+                    category,
+                    details.get('score', 0),
+                    details.get('weight', 0),
+                    details.get('weighted_score', 0)
+                ))
+
+        workbook.save(buffer)
         excel = buffer.getvalue()
         buffer.close()
 
         return excel
 
+    @staticmethod
+    def _header_row(sheet, titles) -> List[WriteOnlyCell]:
+        """Bold header cells, matching the pandas to_excel header"""
+        row = []
+        for title in titles:
+            cell = WriteOnlyCell(sheet, value=title)
+            cell.font = _HEADER_FONT
+            row.append(cell)
+        return row
+
     def send_email_submission(
         self,
         to_email: str,
@@ -167,7 +191,7 @@ class ExportService:
             sender_password = "your_app_password"  # Use app-specific password
 
             # Create message
-            msg = MIMEMultipart()
+            msg = EmailMessage()
             msg['From'] = sender_email
             msg['To'] = to_email
             msg['Subject'] = f"Feasibility Assessment - {survey_data['study_name']} - {survey_data['site_name']}"
@@ -198,27 +222,25 @@ class ExportService:
             Generated by SiteSync - AI-Powered Feasibility Platform
             """
 
-            msg.attach(MIMEText(body, 'plain'))
+            msg.set_content(body)
+
+            filename_base = f'Feasibility_{survey_data["study_name"].replace(" ", "_")}'
 
             # Attach PDF
-            pdf_attachment = MIMEBase('application', 'pdf')
-            pdf_attachment.set_payload(pdf_bytes)
-            encoders.encode_base64(pdf_attachment)
-            pdf_attachment.add_header(
-                'Content-Disposition',
-                f'attachment; filename="Feasibility_{survey_data["study_name"].replace(" ", "_")}.pdf"'
+            msg.add_attachment(
+                pdf_bytes,
+                maintype='application',
+                subtype='pdf',
+                filename=f"{filename_base}.pdf"
             )
-            msg.attach(pdf_attachment)
 
             # Attach Excel
-            excel_attachment = MIMEBase('application', 'vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            excel_attachment.set_payload(excel_bytes)
-            encoders.encode_base64(excel_attachment)
-            excel_attachment.add_header(
-                'Content-Disposition',
-                f'attachment; filename="Feasibility_{survey_data["study_name"].replace(" ", "_")}.xlsx"'
+            msg.add_attachment(
+                excel_bytes,
+                maintype='application',
+                subtype='vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                filename=f"{filename_base}.xlsx"
             )
-            msg.attach(excel_attachment)
 
             # Send email (commented out for demo - would need real SMTP credentials)
             # with smtplib.SMTP(smtp_server, smtp_port) as server:
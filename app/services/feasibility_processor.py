@@ -1,9 +1,127 @@
-from typing import Dict, List, Any, Optional
+import asyncio
+import hashlib
+import threading
+import time
+import orjson
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Any, Optional, Tuple
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from app import models
+from app.services import llm_provider
 from app.services.document_processor import ProtocolDocumentProcessor
-from app.services.scoring import load_site_truth_map
-from app.services.llm_provider import generate
+from app.services.scoring import load_site_truth_map, site_data_version
+from app.services.openai_client import get_openai_client
+
+# Structured verdict for the eligibility-restrictiveness assessment, so the
+# answer is read from a boolean instead of substring-matching free text
+RESTRICTIVENESS_JSON_SCHEMA = {
+    "name": "restrictiveness_verdict",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "restrictive": {"type": "boolean"},
+            "rationale": {"type": "string"},
+        },
+        "required": ["restrictive", "rationale"],
+        "additionalProperties": False,
+    },
+}
+
+# In-process cache of (restrictive, rationale) verdicts keyed by the criteria,
+# so re-running the same protocol skips the LLM call
+RESTRICTIVENESS_CACHE_SIZE = 512
+_restrictiveness_cache: "OrderedDict[str, Tuple[bool, str]]" = OrderedDict()
+_restrictiveness_cache_lock = threading.Lock()  # assessments run in executor threads
+
+def _restrictiveness_cache_key(inclusion: Any, exclusion: Any) -> str:
+    payload = orjson.dumps([inclusion, exclusion], default=str)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+# Separator for the joined equipment labels; can't occur in a label, so a
+# substring hit on the blob is a substring hit on a single label
+_LABEL_SEP = "\x00"
+
+@dataclass(slots=True, frozen=True)
+class SiteRules:
+    """Lowercased site equipment/history strings for capability matching"""
+    equipment_labels: Tuple[str, ...]
+    history_indications: Tuple[str, ...]
+    equipment_label_set: FrozenSet[str]
+    equipment_blob: str
+
+    def has_equipment(self, required_lc: str) -> bool:
+        """True if required_lc is a substring of any site equipment label"""
+        if not self.equipment_labels:
+            return False
+        if required_lc in self.equipment_label_set:
+            return True
+        if _LABEL_SEP in required_lc:
+            return any(required_lc in label for label in self.equipment_labels)
+        return required_lc in self.equipment_blob
+
+# Compiled SiteRules per site, reused until the site's rows change. Versions
+# only see this process's commits, so entries also expire after the TTL to
+# pick up writes made elsewhere (scripts, other workers).
+SITE_RULES_CACHE_SIZE = 256
+SITE_RULES_CACHE_TTL = 300  # seconds
+_site_rules_cache: "OrderedDict[int, Tuple[Tuple[int, int], float, SiteRules]]" = OrderedDict()
+_site_rules_cache_lock = threading.Lock()
+
+def _build_site_rules(site: models.Site) -> SiteRules:
+    equipment_labels = tuple(eq.label.lower().replace(_LABEL_SEP, "") for eq in site.equipment)
+    return SiteRules(
+        equipment_labels=equipment_labels,
+        history_indications=tuple((h.indication or "").lower() for h in site.history),
+        equipment_label_set=frozenset(equipment_labels),
+        equipment_blob=_LABEL_SEP.join(equipment_labels)
+    )
+
+def load_site_rules(site: models.Site) -> SiteRules:
+    """Cached SiteRules, rebuilt when site_data_version changes or the entry expires.
+    On a hit the site's equipment/history relationships are never loaded."""
+    site_id = site.id
+    version = site_data_version(site_id)
+    now = time.monotonic()
+    with _site_rules_cache_lock:
+        cached = _site_rules_cache.get(site_id)
+        if cached is not None and cached[0] == version and cached[1] > now:
+            _site_rules_cache.move_to_end(site_id)
+            return cached[2]
+
+    rules = _build_site_rules(site)
+    with _site_rules_cache_lock:
+        _site_rules_cache[site_id] = (version, now + SITE_RULES_CACHE_TTL, rules)
+        _site_rules_cache.move_to_end(site_id)
+        if len(_site_rules_cache) > SITE_RULES_CACHE_SIZE:
+            _site_rules_cache.popitem(last=False)
+    return rules
+
+# UAB form question mapping, built once at import and read-only
+UAB_QUESTIONS = MappingProxyType({
+    "protocol_basics": (
+        "protocol_title", "protocol_number", "phase", "sponsor",
+        "drug_administration", "population_age", "expected_enrollment"
+    ),
+    "population_assessment": (
+        "participant_health_status", "access_to_population",
+        "enrollment_realistic", "inclusion_exclusion_restrictive"
+    ),
+    "procedures": (
+        "procedures_complex", "pk_samples", "pk_intensive",
+        "special_equipment", "washout_period"
+    ),
+    "site_capabilities": (
+        "workload_manageable", "adequate_staff", "extended_hours",
+        "additional_specialists", "budget_covers"
+    ),
+    "manual_required": (
+        "time_recruitment", "time_visits", "time_monitoring", "time_queries"
+    )
+})
+UAB_TOTAL_QUESTIONS = sum(len(keys) for keys in UAB_QUESTIONS.values())
 
 class FeasibilityProcessor:
     """Main service for processing protocols and generating auto-filled surveys"""
@@ -11,52 +129,46 @@ class FeasibilityProcessor:
     def __init__(self):
         self.doc_processor = ProtocolDocumentProcessor()
 
-        # UAB form question mapping
-        self.uab_questions = {
-            "protocol_basics": [
-                "protocol_title", "protocol_number", "phase", "sponsor",
-                "drug_administration", "population_age", "expected_enrollment"
-            ],
-            "population_assessment": [
-                "participant_health_status", "access_to_population",
-                "enrollment_realistic", "inclusion_exclusion_restrictive"
-            ],
-            "procedures": [
-                "procedures_complex", "pk_samples", "pk_intensive",
-                "special_equipment", "washout_period"
-            ],
-            "site_capabilities": [
-                "workload_manageable", "adequate_staff", "extended_hours",
-                "additional_specialists", "budget_covers"
-            ],
-            "manual_required": [
-                "time_recruitment", "time_visits", "time_monitoring", "time_queries"
-            ]
-        }
+        # UAB form question mapping (shared, read-only)
+        self.uab_questions = UAB_QUESTIONS
+        self._total_questions = UAB_TOTAL_QUESTIONS
 
-    def process_protocol_for_feasibility(self,
-                                       db: Session,
-                                       protocol_pdf_bytes: bytes,
-                                       site_id: int) -> Dict[str, Any]:
+    async def process_protocol_for_feasibility(self,
+                                             db: Session,
+                                             protocol_pdf_bytes: bytes,
+                                             site_id: int) -> Dict[str, Any]:
         """Main processing pipeline: PDF -> extracted data -> auto-filled form"""
 
-        # 1. Extract protocol data
-        protocol_data = self.doc_processor.extract_protocol_data(protocol_pdf_bytes)
-
-        if "error" in protocol_data:
-            return {"error": protocol_data["error"]}
+        loop = asyncio.get_running_loop()
 
-        # 2. Get site profile
+        # 1. Get site profile (cheap; checked first so a bad site_id never
+        # starts an extraction)
         site = db.get(models.Site, site_id)
         if not site:
             return {"error": "Site not found"}
 
+        # 2. Extract protocol data in a worker thread while the site's truth map
+        # loads on this thread (the session never leaves the request thread)
+        extraction = loop.run_in_executor(
+            None, self.doc_processor.extract_protocol_data, protocol_pdf_bytes
+        )
+        site_truth_map = load_site_truth_map(db, site_id)
+        protocol_data = await extraction
+
+        if "error" in protocol_data:
+            return {"error": protocol_data["error"]}
+
+        # Start the LLM assessment now so it overlaps the DB work below
+        ai_assessments = loop.run_in_executor(
+            None, self._ai_powered_assessments, protocol_data
+        )
+
         # 3. Create protocol record in database
-        protocol_record = self._create_protocol_record(db, protocol_data)
+        protocol_id = self._create_protocol_record(db, protocol_data)
 
         # 4. Generate auto-filled responses
-        filled_form = self._generate_feasibility_responses(
-            protocol_data, site, db, site_id
+        filled_form = await self._generate_feasibility_responses(
+            protocol_data, site, site_truth_map, ai_assessments
         )
 
         # 5. Calculate completion stats
@@ -64,7 +176,7 @@ class FeasibilityProcessor:
 
         return {
             "protocol": {
-                "id": protocol_record.id,
+                "id": protocol_id,
                 "data": protocol_data
             },
             "filled_form": filled_form,
@@ -75,88 +187,87 @@ class FeasibilityProcessor:
             }
         }
 
-    def _create_protocol_record(self, db: Session, protocol_data: Dict) -> models.Protocol:
-        """Create Protocol record from extracted data"""
-
-        protocol = models.Protocol(
-            name=protocol_data.get("protocol_title", "Unknown Protocol"),
-            sponsor=protocol_data.get("sponsor", ""),
-            disease=protocol_data.get("indication", ""),
-            phase=protocol_data.get("phase", ""),
-            nct_id=protocol_data.get("protocol_number", ""),
-            notes=f"Auto-extracted with {protocol_data.get('extraction_confidence', 'unknown')} confidence"
-        )
-
-        db.add(protocol)
-        db.commit()
-        db.refresh(protocol)
+    def _create_protocol_record(self, db: Session, protocol_data: Dict) -> int:
+        """Create Protocol record from extracted data, returning its id"""
+
+        # INSERT ... RETURNING gives the id without an ORM object to flush,
+        # refresh or expire; protocol and requirements commit together
+        protocol_id = db.execute(
+            insert(models.Protocol).values(
+                name=protocol_data.get("protocol_title", "Unknown Protocol"),
+                sponsor=protocol_data.get("sponsor", ""),
+                disease=protocol_data.get("indication", ""),
+                phase=protocol_data.get("phase", ""),
+                nct_id=protocol_data.get("protocol_number", ""),
+                notes=f"Auto-extracted with {protocol_data.get('extraction_confidence', 'unknown')} confidence"
+            ).returning(models.Protocol.id)
+        ).scalar_one()
 
         # Create requirements from extracted data
-        self._create_protocol_requirements(db, protocol.id, protocol_data)
+        self._create_protocol_requirements(db, protocol_id, protocol_data)
+        db.commit()
 
-        return protocol
+        return protocol_id
 
     def _create_protocol_requirements(self, db: Session, protocol_id: int, data: Dict):
         """Convert extracted data to ProtocolRequirement records"""
 
-        requirements = []
+        rows = []
 
         # Equipment requirements
         if data.get("equipment_required"):
             for equipment in data["equipment_required"]:
-                req = models.ProtocolRequirement(
-                    protocol_id=protocol_id,
-                    key="equipment",
-                    op="in",
-                    value=equipment,
-                    weight=5,
-                    type="objective",
-                    source_question="Is special equipment required for the study?"
-                )
-                requirements.append(req)
+                rows.append({
+                    "protocol_id": protocol_id,
+                    "key": "equipment",
+                    "op": "in",
+                    "value": equipment,
+                    "weight": 5,
+                    "type": "objective",
+                    "source_question": "Is special equipment required for the study?"
+                })
 
         # Age requirements
         if data.get("population_age"):
-            req = models.ProtocolRequirement(
-                protocol_id=protocol_id,
-                key="patient_age_range",
-                op="==",
-                value=data["population_age"],
-                weight=3,
-                type="objective",
-                source_question="What is the population age?"
-            )
-            requirements.append(req)
+            rows.append({
+                "protocol_id": protocol_id,
+                "key": "patient_age_range",
+                "op": "==",
+                "value": data["population_age"],
+                "weight": 3,
+                "type": "objective",
+                "source_question": "What is the population age?"
+            })
 
         # Enrollment expectations
         if data.get("expected_enrollment"):
             try:
                 enrollment = int(data["expected_enrollment"])
-                req = models.ProtocolRequirement(
-                    protocol_id=protocol_id,
-                    key="annual_eligible_patients",
-                    op=">=",
-                    value=str(int(enrollment * 1.5)),  # 1.5x buffer
-                    weight=4,
-                    type="objective",
-                    source_question="Do we have access to the participant population?"
-                )
-                requirements.append(req)
             except (ValueError, TypeError):
-                pass
-
-        db.add_all(requirements)
-        db.commit()
-
-    def _generate_feasibility_responses(self,
-                                      protocol_data: Dict,
-                                      site: models.Site,
-                                      db: Session,
-                                      site_id: int) -> Dict[str, Any]:
+                enrollment = None
+            if enrollment is not None:
+                rows.append({
+                    "protocol_id": protocol_id,
+                    "key": "annual_eligible_patients",
+                    "op": ">=",
+                    "value": str(enrollment + enrollment // 2),  # 1.5x buffer
+                    "weight": 4,
+                    "type": "objective",
+                    "source_question": "Do we have access to the participant population?"
+                })
+
+        # Single executemany INSERT; nothing is read back from these rows
+        if rows:
+            db.execute(insert(models.ProtocolRequirement), rows)
+
+    async def _generate_feasibility_responses(self,
+                                            protocol_data: Dict,
+                                            site: models.Site,
+                                            site_truth_map: Dict[str, str],
+                                            ai_assessments: "asyncio.Future[Dict[str, Any]]") -> Dict[str, Any]:
         """Generate auto-filled responses for feasibility questions"""
 
         responses = {}
-        site_truth_map = load_site_truth_map(db, site_id)
 
         # Protocol basics (high confidence, auto-lock)
         basic_fields = {
@@ -180,10 +291,10 @@ class FeasibilityProcessor:
                 }
 
         # Site capability assessments
-        responses.update(self._assess_site_capabilities(protocol_data, site_truth_map, db, site_id))
+        responses.update(self._assess_site_capabilities(protocol_data, site_truth_map, site))
 
-        # AI-powered assessments
-        responses.update(self._ai_powered_assessments(protocol_data))
+        # AI-powered assessments (started by the caller)
+        responses.update(await ai_assessments)
 
         # Manual questions (provide helpful prompts)
         responses.update(self._manual_question_prompts(protocol_data))
@@ -191,7 +302,7 @@ class FeasibilityProcessor:
         return responses
 
     def _assess_site_capabilities(self, protocol_data: Dict, site_truth_map: Dict,
-                                db: Session, site_id: int) -> Dict[str, Any]:
+                                site: models.Site) -> Dict[str, Any]:
         """Assess site capabilities using rule-based matching"""
 
         responses = {}
@@ -213,16 +324,11 @@ class FeasibilityProcessor:
         # Equipment availability
         required_equipment = protocol_data.get("equipment_required", [])
         if required_equipment and isinstance(required_equipment, list):
-            site_equipment = db.query(models.SiteEquipment).filter(
-                models.SiteEquipment.site_id == site_id
-            ).all()
-
-            site_equipment_names = [eq.label.lower() for eq in site_equipment]
-            missing_equipment = []
-
-            for req_eq in required_equipment:
-                if not any(req_eq.lower() in site_eq for site_eq in site_equipment_names):
-                    missing_equipment.append(req_eq)
+            site_rules = load_site_rules(site)
+            missing_equipment = [
+                req_eq for req_eq in required_equipment
+                if not site_rules.has_equipment(req_eq.lower())
+            ]
 
             if missing_equipment:
                 responses["special_equipment"] = {
@@ -244,13 +350,10 @@ class FeasibilityProcessor:
         # Experience with sponsor
         sponsor = protocol_data.get("sponsor", "")
         if sponsor:
-            site_history = db.query(models.SiteHistory).filter(
-                models.SiteHistory.site_id == site_id
-            ).all()
-
+            sponsor_lc = sponsor.lower()
             has_sponsor_experience = any(
-                sponsor.lower() in (h.indication or "").lower()
-                for h in site_history
+                sponsor_lc in indication
+                for indication in load_site_rules(site).history_indications
             )
 
             responses["experience_with_sponsor"] = {
@@ -279,24 +382,42 @@ class FeasibilityProcessor:
             INCLUSION: {inclusion}
             EXCLUSION: {exclusion}
 
-            Answer "Yes" if restrictive, "No" if reasonable. Provide brief rationale.
+            Set "restrictive" to true if restrictive, false if reasonable.
+            Keep "rationale" to one sentence under 200 characters.
             """
 
             try:
-                messages = [
-                    {"role": "system", "content": "You are a clinical research expert."},
-                    {"role": "user", "content": prompt}
-                ]
-
-                ai_response = generate(messages, temperature=0.3, max_tokens=1500)  # High limit for gpt-5-mini reasoning
-                is_restrictive = "yes" in ai_response.lower()
-
+                # Honor LLM_PROVIDER like the rest of the LLM paths
+                if llm_provider.PROVIDER != "openai":
+                    raise RuntimeError(f"LLM provider {llm_provider.PROVIDER!r} does not support structured output")
+                cache_key = _restrictiveness_cache_key(inclusion, exclusion)
+                with _restrictiveness_cache_lock:
+                    verdict = _restrictiveness_cache.get(cache_key)
+                    if verdict is not None:
+                        _restrictiveness_cache.move_to_end(cache_key)
+                if verdict is None:
+                    result = get_openai_client().create_json_completion(
+                        prompt,
+                        system_message="You are a clinical research expert.",
+                        temperature=0.3,
+                        max_tokens=1500,  # High limit for gpt-5-mini reasoning
+                        json_schema=RESTRICTIVENESS_JSON_SCHEMA
+                    )
+                    if not isinstance(result.get("restrictive"), bool):
+                        raise ValueError("Missing restrictive verdict")
+                    verdict = (result["restrictive"], str(result.get("rationale", "")))
+                    with _restrictiveness_cache_lock:
+                        _restrictiveness_cache[cache_key] = verdict
+                        if len(_restrictiveness_cache) > RESTRICTIVENESS_CACHE_SIZE:
+                            _restrictiveness_cache.popitem(last=False)
+
+                is_restrictive, rationale = verdict
                 responses["inclusion_exclusion_restrictive"] = {
                     "answer": "Yes" if is_restrictive else "No",
                     "confidence": "medium",
                     "locked": False,
                     "evidence": "AI analysis of eligibility criteria",
-                    "rationale": ai_response[:200]
+                    "rationale": rationale[:200]
                 }
 
             except Exception:
@@ -359,16 +480,23 @@ class FeasibilityProcessor:
     def _calculate_completion_stats(self, filled_form: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate completion statistics for the form"""
 
-        total_questions = len(self.uab_questions["protocol_basics"]) + \
-                         len(self.uab_questions["population_assessment"]) + \
-                         len(self.uab_questions["procedures"]) + \
-                         len(self.uab_questions["site_capabilities"]) + \
-                         len(self.uab_questions["manual_required"])
-
-        auto_filled = len([q for q in filled_form.values() if q.get("answer")])
-        high_confidence = len([q for q in filled_form.values() if q.get("confidence") == "high"])
-        locked_answers = len([q for q in filled_form.values() if q.get("locked")])
-        manual_required = len([q for q in filled_form.values() if q.get("confidence") == "manual"])
+        total_questions = self._total_questions
+
+        # One pass over the form for every counter
+        auto_filled = high_confidence = locked_answers = manual_required = 0
+        review_needed = []
+        for key, data in filled_form.items():
+            if data.get("answer"):
+                auto_filled += 1
+            if data.get("locked"):
+                locked_answers += 1
+            confidence = data.get("confidence")
+            if confidence == "high":
+                high_confidence += 1
+            elif confidence == "manual":
+                manual_required += 1
+            elif confidence in ("medium", "low"):
+                review_needed.append(key)
 
         time_saved = min(45, auto_filled * 2.5)  # Conservative estimate
 
@@ -380,8 +508,5 @@ class FeasibilityProcessor:
             "manual_required": manual_required,
             "completion_percentage": round((auto_filled / max(total_questions, 1)) * 100),
             "estimated_time_saved_minutes": round(time_saved),
-            "review_needed": [
-                key for key, data in filled_form.items()
-                if data.get("confidence") in ["medium", "low"]
-            ]
+            "review_needed": review_needed
         }
\ No newline at end of file
@@ -1,11 +1,16 @@
 # app/llm_provider.py
 from __future__ import annotations
 import os
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 
 PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()  # "openai" | "none"
 
-def _openai_chat(messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 2000) -> str:
+def _openai_chat(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.2,
+    max_tokens: int = 2000,
+    accept: Optional[Callable[[str], bool]] = None
+) -> str:
     """
     Call OpenAI using unified client with automatic parameter detection
     """
@@ -36,7 +41,8 @@ def _openai_chat(messages: List[Dict[str, str]], temperature: float = 0.2, max_t
         system_message=system_message or "You are a helpful assistant.",
         user_message=user_message,
         temperature=temperature,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        accept=accept
     )
 
 def _local_fallback(messages: List[Dict[str, str]], **_) -> str:
@@ -49,14 +55,20 @@ def _local_fallback(messages: List[Dict[str, str]], **_) -> str:
         f"System:\n{system}\n\nUser:\n{user}\n"
     )
 
-def generate(messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 2000) -> str:
+def generate(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.2,
+    max_tokens: int = 2000,
+    accept: Optional[Callable[[str], bool]] = None
+) -> str:
     """
     Generate a completion using configured LLM provider.
     Routes through unified OpenAI client for automatic parameter detection.
+    `accept` decides whether the reply is usable enough to be cached.
     """
     if PROVIDER == "openai":
         try:
-            return _openai_chat(messages, temperature=temperature, max_tokens=max_tokens)
+            return _openai_chat(messages, temperature=temperature, max_tokens=max_tokens, accept=accept)
         except Exception as e:
             print(f"OpenAI call failed: {e}")
             # Don't crash the demo — fall back to local
@@ -3,13 +3,53 @@ Unified OpenAI Client for gpt-5-mini (stable recipe).
 OpenAI SDK 2.0.1, Chat Completions API, max_tokens parameter only.
 """
 import os
-import json
+import re
+import hashlib
 import logging
-from typing import Dict, Any, Optional
+import threading
+import orjson
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional
 from openai import OpenAI
 
 logger = logging.getLogger(__name__)
 
+# Exact-match cache of completed responses keyed by a hash of the full request
+# (model, messages, token limit, temperature, response_format), with message
+# whitespace collapsed so prompts differing only in indentation/line breaks
+# share an entry. Only responses that finished normally and that the caller's
+# `accept` check (if any) approves are stored, so unusable output is retried.
+COMPLETION_CACHE_SIZE = 1024
+_completion_cache: "OrderedDict[str, str]" = OrderedDict()
+_completion_cache_lock = threading.Lock()  # the client is shared across executor threads
+
+def _completion_cache_key(kwargs: Dict[str, Any]) -> str:
+    normalized = dict(kwargs)
+    normalized["messages"] = [
+        {**message, "content": " ".join(message["content"].split())}
+        for message in kwargs["messages"]
+    ]
+    return hashlib.sha256(orjson.dumps(normalized, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def _strip_code_fences(response_text: str) -> str:
+    """Strip markdown code fences around a JSON reply"""
+    response_text = response_text.strip()
+    if response_text.startswith("```json"):
+        response_text = response_text[7:]
+    if response_text.startswith("```"):
+        response_text = response_text[3:]
+    if response_text.endswith("```"):
+        response_text = response_text[:-3]
+    return response_text.strip()
+
+def _is_json(response_text: str) -> bool:
+    """Cache check for JSON completions: only replies _parse_json can read"""
+    try:
+        orjson.loads(_strip_code_fences(response_text))
+    except orjson.JSONDecodeError:
+        return False
+    return True
+
 class UnifiedOpenAIClient:
     """
     Stable OpenAI client for gpt-5-mini.
@@ -25,38 +65,37 @@ class UnifiedOpenAIClient:
             raise ValueError("OPENAI_API_KEY not set")
         self.client = OpenAI(api_key=self.api_key)
         self.model = os.getenv("LLM_MODEL", "gpt-5-mini")
+        # Smaller/cheaper model for low-risk lookups; defaults to the main model
+        self.fast_model = os.getenv("LLM_FAST_MODEL", self.model)
 
-    def chat_completion(
+    def _build_request(
         self,
         system_message: str,
         user_message: str,
-        temperature: float = 0.1,
-        max_tokens: int = 2000,
-        response_format: Optional[Dict] = None
-    ) -> str:
-        """
-        Call Chat Completions API.
-
-        gpt-4o-mini: uses max_tokens + response_format (standard)
-        gpt-5-mini: uses max_completion_tokens (reasoning model)
-        """
+        temperature: float,
+        max_tokens: int,
+        response_format: Optional[Dict],
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Build Chat Completions kwargs for `model` (default: the configured model)"""
+        model = model or self.model
         messages = [
             {"role": "system", "content": system_message or "You are a helpful assistant."},
             {"role": "user", "content": user_message}
         ]
 
         # Model-specific parameters
-        if "gpt-5" in self.model.lower():
+        if "gpt-5" in model.lower():
             # gpt-5-mini: reasoning model, needs max_completion_tokens
             kwargs = {
-                "model": self.model,
+                "model": model,
                 "messages": messages,
                 "max_completion_tokens": max_tokens
             }
         else:
             # gpt-4o-mini and others: standard models
             kwargs = {
-                "model": self.model,
+                "model": model,
                 "messages": messages,
                 "max_tokens": max_tokens,
                 "temperature": temperature
@@ -64,12 +103,47 @@ class UnifiedOpenAIClient:
             if response_format:
                 kwargs["response_format"] = response_format
 
+        return kwargs
+
+    def chat_completion(
+        self,
+        system_message: str,
+        user_message: str,
+        temperature: float = 0.1,
+        max_tokens: int = 2000,
+        response_format: Optional[Dict] = None,
+        model: Optional[str] = None,
+        accept: Optional[Callable[[str], bool]] = None
+    ) -> str:
+        """
+        Call Chat Completions API.
+
+        gpt-4o-mini: uses max_tokens + response_format (standard)
+        gpt-5-mini: uses max_completion_tokens (reasoning model)
+        Identical requests are answered from the in-process completion cache;
+        a response is cached only if `accept(content)` is true (when given).
+        """
+        kwargs = self._build_request(system_message, user_message, temperature, max_tokens, response_format, model)
+
+        cache_key = _completion_cache_key(kwargs)
+        with _completion_cache_lock:
+            cached = _completion_cache.get(cache_key)
+            if cached is not None:
+                _completion_cache.move_to_end(cache_key)
+                return cached
+
         response = self.client.chat.completions.create(**kwargs)
         content = response.choices[0].message.content or ""
         finish_reason = response.choices[0].finish_reason
 
+        if content and finish_reason == "stop" and (accept is None or accept(content)):
+            with _completion_cache_lock:
+                _completion_cache[cache_key] = content
+                if len(_completion_cache) > COMPLETION_CACHE_SIZE:
+                    _completion_cache.popitem(last=False)
+
         # Log for debugging truncation
-        logger.info(f"OpenAI response: model={self.model}, length={len(content)}, finish_reason={finish_reason}")
+        logger.info(f"OpenAI response: model={kwargs['model']}, length={len(content)}, finish_reason={finish_reason}")
 
         if not content:
             logger.error(f"Empty response! finish_reason={finish_reason}, usage={response.usage}")
@@ -96,52 +170,105 @@ class UnifiedOpenAIClient:
         prompt: str,
         system_message: Optional[str] = None,
         temperature: float = 0.1,
-        max_tokens: int = 2000
+        max_tokens: int = 2000,
+        json_schema: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
-        Get JSON response.
+        Get JSON response (see _json_messages for per-model handling).
+        """
+        system, user, response_format = self._json_messages(prompt, system_message, json_schema=json_schema)
+        response_text = self.chat_completion(
+            system_message=system,
+            user_message=user,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format=response_format,
+            accept=_is_json
+        )
+        return self._parse_json(response_text)
 
-        gpt-4o-mini: uses response_format=json_object (fast, reliable)
+    def create_json_completion_with_cutoff(
+        self,
+        prompt: str,
+        system_message: Optional[str] = None,
+        temperature: float = 0.1,
+        max_tokens: int = 2000,
+        cutoff_field: str = "confidence_score",
+        cutoff_below: float = 0.3,
+        model: Optional[str] = None,
+        json_schema: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Streaming variant of create_json_completion.
+
+        Watches the streamed JSON for `cutoff_field`; as soon as its value is
+        parsed and is below `cutoff_below`, the stream is closed and None is
+        returned, so no tokens are spent on the rest of an answer the caller
+        would discard. Otherwise returns the parsed JSON like create_json_completion.
+        """
+        system, user, response_format = self._json_messages(prompt, system_message, model, json_schema)
+        kwargs = self._build_request(system, user, temperature, max_tokens, response_format, model)
+        cutoff_re = re.compile(r'"' + re.escape(cutoff_field) + r'"\s*:\s*"?(-?\d+(?:\.\d+)?)"?\s*[,}]')
+
+        stream = self.client.chat.completions.create(stream=True, **kwargs)
+        parts = []
+        scan_from = 0
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                # Only rescan the tail that could contain the field
+                text = "".join(parts)
+                match = cutoff_re.search(text, max(0, scan_from - len(cutoff_field) - 32))
+                scan_from = len(text)
+                if match and float(match.group(1)) < cutoff_below:
+                    logger.info(f"OpenAI stream cut off early: {cutoff_field}={match.group(1)} < {cutoff_below}")
+                    return None
+        finally:
+            stream.close()
+
+        return self._parse_json("".join(parts))
+
+    def _json_messages(
+        self,
+        prompt: str,
+        system_message: Optional[str],
+        model: Optional[str] = None,
+        json_schema: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Messages + response_format for a JSON request.
+
+        gpt-4o-mini: uses response_format=json_object, or strict json_schema
+                     (constrained decoding) when a {"name", "schema"} is given
         gpt-5-mini: manual parsing (response_format not supported)
         """
-        if "gpt-5" in self.model.lower():
+        if "gpt-5" in (model or self.model).lower():
             # gpt-5-mini: explicit prompt + manual parsing
             enhanced_prompt = f"{prompt}\n\nIMPORTANT: Return ONLY valid JSON with no additional text before or after."
             enhanced_system = (system_message or "You are a helpful assistant.") + " Always return valid JSON only."
-
-            response_text = self.chat_completion(
-                system_message=enhanced_system,
-                user_message=enhanced_prompt,
-                max_tokens=max_tokens
-            )
+            return enhanced_system, enhanced_prompt, None
+        # gpt-4o-mini: use response_format
+        if json_schema:
+            response_format = {"type": "json_schema", "json_schema": {**json_schema, "strict": True}}
         else:
-            # gpt-4o-mini: use response_format
-            response_text = self.chat_completion(
-                system_message=system_message or "You are a helpful assistant.",
-                user_message=prompt,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                response_format={"type": "json_object"}
-            )
-
-        # Strip markdown code fences
-        response_text = response_text.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
+            response_format = {"type": "json_object"}
+        return system_message or "You are a helpful assistant.", prompt, response_format
+
+    def _parse_json(self, response_text: str) -> Dict[str, Any]:
+        response_text = _strip_code_fences(response_text)
 
         # Parse JSON
         try:
-            return json.loads(response_text)
-        except json.JSONDecodeError as e:
+            return orjson.loads(response_text)
+        except orjson.JSONDecodeError as e:
             logger.error(f"JSON parse failed: {response_text[:200]}")
             raise ValueError(f"LLM returned invalid JSON: {str(e)}")
 
-
 # Global client instance
 _client_instance = None
 
@@ -1,4 +1,12 @@
-from typing import Any, Dict, List, Optional
+import itertools
+import operator
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from app import models
 
@@ -13,8 +21,10 @@ def _to_number(s: str | int | float | None):
         except:
             return None
 
+@lru_cache(maxsize=1024)
 def parse_value(raw: str | None):
-    """Turn a stored text 'value' into python: list, number, bool, or str."""
+    """Turn a stored text 'value' into python: list, number, bool, or str.
+    Memoized (requirement values repeat across scoring calls) - treat the result as read-only."""
     if raw is None:
         return None
     txt = str(raw).strip()
@@ -35,41 +45,114 @@ def parse_value(raw: str | None):
         return n
     return txt
 
+def _rule_in(fv: Any, rv: Any) -> bool:
+    # membership, case-insensitive for strings
+    if not isinstance(rv, list):
+        return False
+    return str(fv).strip().lower() in [str(x).strip().lower() for x in rv]
+
+def _rule_eq(fv: Any, rv: Any) -> bool:
+    return str(fv).strip().lower() == str(rv).strip().lower()
+
+def _numeric_rule(compare: Callable[[float, float], bool]) -> Callable[[Any, Any], bool]:
+    def rule(fv: Any, rv: Any) -> bool:
+        fv_num = _to_number(fv)
+        rv_num = _to_number(rv)
+        if fv_num is None or rv_num is None:
+            return False
+        return compare(fv_num, rv_num)
+    return rule
+
+# Operator dispatch table: op -> check(field_value, rule_value)
+OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "in": _rule_in,
+    "==": _rule_eq,
+    ">=": _numeric_rule(operator.ge),
+    "<=": _numeric_rule(operator.le),
+    ">": _numeric_rule(operator.gt),
+    "<": _numeric_rule(operator.lt),
+}
+
 def evaluate_rule(op: str, rule_value: Any, field_value: Optional[str]) -> bool:
     """Compare field_value (string from DB) to rule_value using operator."""
     if field_value is None:
         return False
+    check = OPS.get(op)
+    return check(field_value, rule_value) if check else False
 
-    fv = field_value
-    rv = rule_value
+# --- Site truth map cache ---
+# Truth maps are cached per site and invalidated through a per-site version that is
+# bumped after any commit touching SiteTruthField / SitePatientCapability rows (and
+# SiteEquipment / SiteHistory, which other per-site caches key on via
+# site_data_version). Bulk query().update()/delete() statements don't say which
+# site they hit, so they bump a global generation that invalidates every site.
+# Versions only track writes made through this process's ORM sessions, so entries
+# also expire after _TRUTH_CACHE_TTL to pick up writes made elsewhere.
+_TRUTH_MODELS = (models.SiteTruthField, models.SitePatientCapability,
+                 models.SiteEquipment, models.SiteHistory)
+_TRUTH_CACHE_SIZE = 256
+_TRUTH_CACHE_TTL = 300  # seconds
+_truth_versions: Dict[int, int] = {}
+_truth_generation = 0
+_truth_cache: "OrderedDict[int, Tuple[Tuple[int, int], float, Dict[str, str]]]" = OrderedDict()
+_truth_cache_lock = threading.Lock()  # sync routes run in FastAPI's threadpool
 
-    # Handle "in" as membership (case-insensitive for strings)
-    if op == "in":
-        if not isinstance(rv, list):
-            return False
-        return str(fv).strip().lower() in [str(x).strip().lower() for x in rv]
+def _truth_version(site_id: int) -> Tuple[int, int]:
+    return (_truth_generation, _truth_versions.get(site_id, 0))
 
-    if op == "==":
-        return str(fv).strip().lower() == str(rv).strip().lower()
+def site_data_version(site_id: int) -> Tuple[int, int]:
+    """Opaque version of a site's truth/capability/equipment/history rows; changes after each committed write."""
+    return _truth_version(site_id)
 
-    # Numeric compare
-    fv_num = _to_number(fv)
-    rv_num = _to_number(rv)
-    if op in (">=", "<=", ">", "<"):
-        if fv_num is None or rv_num is None:
-            return False
-        if op == ">=":
-            return fv_num >= rv_num
-        if op == "<=":
-            return fv_num <= rv_num
-        if op == ">":
-            return fv_num > rv_num
-        if op == "<":
-            return fv_num < rv_num
+@event.listens_for(Session, "after_flush")
+def _record_truth_writes(session, flush_context):
+    pending = session.info.setdefault("truth_sites_written", set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, _TRUTH_MODELS):
+            pending.add(obj.site_id)
 
-    return False
+@event.listens_for(Session, "do_orm_execute")
+def _record_bulk_truth_writes(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, _TRUTH_MODELS):
+        orm_execute_state.session.info["truth_bulk_write"] = True
+
+@event.listens_for(Session, "after_commit")
+def _bump_truth_versions(session):
+    # Bump only once the write is committed, so a concurrent reader can't
+    # cache pre-commit data under the new version
+    global _truth_generation
+    if session.info.pop("truth_bulk_write", False):
+        _truth_generation += 1
+    for site_id in session.info.pop("truth_sites_written", ()):
+        _truth_versions[site_id] = _truth_versions.get(site_id, 0) + 1
+
+@event.listens_for(Session, "after_rollback")
+def _discard_truth_writes(session):
+    session.info.pop("truth_bulk_write", None)
+    session.info.pop("truth_sites_written", None)
 
 def load_site_truth_map(db: Session, site_id: int) -> Dict[str, str]:
+    """Cached site truth map (see _build_site_truth_map). Returns a fresh dict each call."""
+    version = _truth_version(site_id)
+    now = time.monotonic()
+    with _truth_cache_lock:
+        cached = _truth_cache.get(site_id)
+        if cached is not None and cached[0] == version and cached[1] > now:
+            _truth_cache.move_to_end(site_id)
+            return dict(cached[2])
+
+    tmap = _build_site_truth_map(db, site_id)
+    with _truth_cache_lock:
+        _truth_cache[site_id] = (version, now + _TRUTH_CACHE_TTL, tmap)
+        _truth_cache.move_to_end(site_id)
+        if len(_truth_cache) > _TRUTH_CACHE_SIZE:
+            _truth_cache.popitem(last=False)
+    return dict(tmap)
+
+def _build_site_truth_map(db: Session, site_id: int) -> Dict[str, str]:
     """Collect SiteTruthField + some patient capability fields into a single map."""
     tmap: Dict[str, str] = {}
     # base truth fields
@@ -102,17 +185,81 @@ def load_site_truth_map(db: Session, site_id: int) -> Dict[str, str]:
             tmap["annual_eligible_patients"] = str(max(vols))
     return tmap
 
-def score_protocol_for_site(db: Session, protocol_id: int, site_id: int) -> Dict[str, Any]:
+# Key-token normalization used to match requirement keys to site truth keys that
+# name the same field differently (e.g. "pi_specialty" vs "investigator_specialty").
+_KEY_SYNONYMS = {
+    "pi": "investigator", "investigators": "investigator", "subinvestigator": "investigator",
+    "crc": "coordinator", "coordinators": "coordinator",
+    "num": "count", "number": "count", "n": "count",
+    "yr": "years", "yrs": "years", "year": "years",
+    "scanners": "scanner", "patients": "patient",
+}
+_KEY_STOPWORDS = {"principal", "site", "the", "of"}
+
+def _key_tokens(key: str) -> frozenset:
+    tokens = set()
+    for tok in re.split(r"[^a-z0-9]+", key.lower()):
+        if not tok or tok in _KEY_STOPWORDS:
+            continue
+        tokens.add(_KEY_SYNONYMS.get(tok, tok))
+    return frozenset(tokens)
+
+def _build_key_index(tmap: Dict[str, str]) -> Dict[frozenset, Optional[str]]:
+    """
+    Index site truth keys by normalized token set, both for the full key and for
+    its last dotted segment ("equipment.ct_scanner" -> {ct, scanner}). Token sets
+    shared by more than one key map to None so ambiguous lookups never resolve.
+    """
+    index: Dict[frozenset, Optional[str]] = {}
+    for key in tmap:
+        for tokens in {_key_tokens(key), _key_tokens(key.rsplit(".", 1)[-1])}:
+            if tokens:
+                index[tokens] = key if index.get(tokens, key) == key else None
+    return index
+
+def _resolve_truth_key(key: str, index: Dict[frozenset, Optional[str]]) -> Optional[str]:
+    """Find the site truth key naming the same field as `key`, if exactly one does."""
+    return index.get(_key_tokens(key)) or index.get(_key_tokens(key.rsplit(".", 1)[-1]))
+
+def lookup_truth_value(tmap: Dict[str, str], key: str,
+                       key_index: Dict[frozenset, Optional[str]]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (truth_key, value) for requirement `key`: the exact truth key if present, else the
+    single site key naming the same field. `key_index` is filled lazily on the first
+    miss; pass the same (initially empty) dict for every lookup against one tmap.
+    """
+    val = tmap.get(key)
+    if val is not None:
+        return key, val
+    if not key_index:
+        key_index.update(_build_key_index(tmap))
+    truth_key = _resolve_truth_key(key, key_index)
+    if truth_key is None:
+        return None, None
+    return truth_key, tmap.get(truth_key)
+
+def score_protocol_for_site(
+    db: Session,
+    protocol_id: int,
+    site_id: int,
+    reqs: Optional[List[models.ProtocolRequirement]] = None,
+    tmap: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """Score a site against a protocol. Callers that already loaded the
+    requirements and/or site truth map can pass them to skip the re-query."""
     prot = db.get(models.Protocol, protocol_id)
     if not prot:
         return {"error": "protocol_not_found"}
 
-    reqs = db.query(models.ProtocolRequirement).filter(models.ProtocolRequirement.protocol_id == protocol_id).all()
-    tmap = load_site_truth_map(db, site_id)
+    if reqs is None:
+        reqs = db.query(models.ProtocolRequirement).filter(models.ProtocolRequirement.protocol_id == protocol_id).all()
+    if tmap is None:
+        tmap = load_site_truth_map(db, site_id)
 
     total_weight = sum(r.weight for r in reqs if r.type == "objective") or 1
     score = 0
     matches, misses, subjective = [], [], []
+    key_index: Dict[frozenset, Optional[str]] = {}
 
     for r in reqs:
         rv = parse_value(r.value)
@@ -122,7 +269,7 @@ def score_protocol_for_site(db: Session, protocol_id: int, site_id: int) -> Dict
                 "source_question": r.source_question
             })
             continue
-        val = tmap.get(r.key)
+        _, val = lookup_truth_value(tmap, r.key, key_index)
         ok = evaluate_rule(r.op, rv, val)
         (matches if ok else misses).append({
             "key": r.key, "value": val, "op": r.op, "target": rv, "weight": r.weight,
@@ -5,7 +5,9 @@ Extracts and categorizes questions from ANY feasibility survey document
 
 import re
 import json
+import hashlib
 import logging
+from collections import OrderedDict
 from typing import List, Dict, Any, Tuple, Optional
 from dataclasses import dataclass
 import os
@@ -16,6 +18,15 @@ from app.services.openai_client import get_openai_client
 
 logger = logging.getLogger(__name__)
 
+# In-process cache of successful AI extractions keyed by document content hash,
+# so re-uploading the same survey skips text extraction and the LLM call
+EXTRACTION_CACHE_SIZE = 64
+_extraction_cache: "OrderedDict[str, List[ExtractedQuestion]]" = OrderedDict()
+
+def _extraction_cache_key(file_content: bytes, filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    return f"{hashlib.sha256(file_content).hexdigest()}{extension}"
+
 class QuestionType(Enum):
     BOOLEAN = "boolean"
     NUMBER = "number"
@@ -66,6 +77,13 @@ class UniversalSurveyParser:
         logger.info(f"🔍 Starting universal extraction for file: {filename}")
         logger.info(f"📄 File content size: {len(file_content)} bytes")
 
+        cache_key = _extraction_cache_key(file_content, filename)
+        cached = _extraction_cache.get(cache_key)
+        if cached is not None:
+            _extraction_cache.move_to_end(cache_key)
+            logger.info(f"✓ Reusing cached extraction: {len(cached)} questions from {filename}")
+            return list(cached)
+
         try:
             # First, extract raw text from document
             document_text = await self._extract_text_from_file(file_content, filename)
@@ -94,6 +112,9 @@ class UniversalSurveyParser:
 
             if extracted_questions:
                 logger.info(f"✓ AI extraction successful: {len(extracted_questions)} questions from {filename}")
+                _extraction_cache[cache_key] = list(extracted_questions)
+                if len(_extraction_cache) > EXTRACTION_CACHE_SIZE:
+                    _extraction_cache.popitem(last=False)
                 return extracted_questions
             else:
                 # If AI extraction returns no questions, use text-based fallback